@@ -0,0 +1,202 @@
+from flask import Blueprint, Response, request, url_for
+from models import *
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+# ----------------------------------------------------------------------------#
+# Serialization.
+# ----------------------------------------------------------------------------#
+
+
+def json_default(value):
+    if isinstance(value, Enum):
+        return value.value
+
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload):
+    # orjson serializes datetimes and enums natively and several times faster than json
+    if orjson is not None:
+        return orjson.dumps(payload, default=json_default)
+
+    return json.dumps(payload, default=json_default, separators=(',', ':'))
+
+
+def json_response(payload, status=200):
+    return Response(dumps(payload), status=status, mimetype='application/json')
+
+
+def error_response(status, error):
+    return json_response({"status": "failed", "error": error}, status)
+
+
+# ----------------------------------------------------------------------------#
+# Resources.
+# ----------------------------------------------------------------------------#
+
+
+class Resource:
+    model = None
+
+    # columns always loaded, the keyset pagination sorts on them
+    sort_fields = ('id',)
+
+    # values returned next to the entity's columns
+    extras = ()
+
+    @classmethod
+    def fields(cls):
+        return [c.key for c in cls.model.__table__.columns]
+
+    @classmethod
+    def requested_fields(cls):
+        """
+        (1) Reads the comma separated `fields` argument, all fields by default
+        :return: the list of fields, raises InvalidArgument on unknown ones
+        """
+        fields = [f for f in request.args.get('fields', '').split(',') if f]
+        known = cls.fields() + list(cls.extras)
+        unknown = [f for f in fields if f not in known]
+
+        if unknown:
+            raise InvalidArgument(f"unknown field(s) {', '.join(unknown)}, choose from {', '.join(known)}")
+
+        return fields or known
+
+    @classmethod
+    def query(cls, fields):
+        # the models' api_query joins the extras, only the requested columns are loaded
+        columns = {*cls.sort_fields, *(f for f in fields if f not in cls.extras)}
+        return cls.model.api_query(load_only=db.load_only(*columns))
+
+    @classmethod
+    def sort_keys(cls):
+        return tuple(getattr(cls.model, f) for f in cls.sort_fields)
+
+    @classmethod
+    def serialize(cls, row, fields):
+        # rows are (entity, *extras), only the loaded columns are read from the entity
+        entity = row[0]
+        return {
+            f: getattr(row, f) if f in cls.extras else getattr(entity, f)
+            for f in fields
+        }
+
+    @classmethod
+    def list(cls):
+        fields = cls.requested_fields()
+
+        # a malformed cursor raises InvalidArgument before the query runs
+        page = cls.model.get_page(
+            query=cls.query(fields),
+            sort_keys=cls.sort_keys(),
+            cursor=request.args.get('cursor'),
+            per_page=request.args.get('per_page', type=int)
+        )
+
+        if page is False:
+            return error_response(500, "the request could not be completed")
+
+        next_cursor = page.get('next_cursor')
+
+        return json_response({
+            "data": [cls.serialize(row, fields) for row in page.get('data')],
+            "cursor": page.get('cursor'),
+            "next_cursor": next_cursor,
+            "per_page": page.get('per_page'),
+            "next": url_for(
+                request.endpoint,
+                **{**request.view_args, **request.args.to_dict(), "cursor": next_cursor},
+                _external=True
+            ) if next_cursor else None
+        })
+
+    @classmethod
+    def detail(cls, id):
+        fields = cls.requested_fields()
+        row = cls.model.get_one_from(query=cls.query(fields), id=id)
+
+        if row is False:
+            return error_response(500, "the request could not be completed")
+
+        if row is None:
+            return error_response(404, f"{cls.model.__name__.lower()} {id} does not exist")
+
+        return json_response({"data": cls.serialize(row, fields)})
+
+
+class ProfileResource(Resource):
+    sort_fields = ('name', 'id')
+
+    extras = ('upcoming_shows_count', 'past_shows_count', 'next_show_time')
+
+
+class VenueResource(ProfileResource):
+    model = Venue
+
+
+class ArtistResource(ProfileResource):
+    model = Artist
+
+
+class ShowResource(Resource):
+    model = Show
+
+    sort_fields = ('start_time', 'id')
+
+    extras = ('venue_name', 'artist_name', 'artist_image_link')
+
+
+RESOURCES = {
+    'venues': VenueResource,
+    'artists': ArtistResource,
+    'shows': ShowResource
+}
+
+
+# ----------------------------------------------------------------------------#
+# Endpoints.
+# ----------------------------------------------------------------------------#
+
+
+api = Blueprint('api_v1', __name__, url_prefix='/api/v1')
+
+
+@api.errorhandler(InvalidArgument)
+def bad_request(error):
+    # only arguments that could not be parsed, any other error is a 500
+    return error_response(400, str(error))
+
+
+@api.route('/<any(venues, artists, shows):kind>')
+def list_resources(kind):
+    """
+    (1) Creates an Endpoint listing venues, artists or shows a page at a time
+    :param kind: (str) 'venues', 'artists' or 'shows'
+    :return: json response including
+             'data': the page of rows, each holding the `?fields=` asked for
+                     (all by default), venues and artists with their upcoming
+                     and past shows counts, shows with their venue and artist names,
+             'next_cursor' and 'next': where the next page starts,
+                     `?cursor=` and `?per_page=` select the page.
+    """
+    return RESOURCES[kind].list()
+
+
+@api.route('/<any(venues, artists, shows):kind>/<int:id>')
+def get_resource(kind, id):
+    """
+    (1) Creates an Endpoint for a single venue, artist or show
+    :param kind: (str) 'venues', 'artists' or 'shows'
+    :param id: (int) of the row
+    :return: json response including 'data', see `list_resources`
+    """
+    return RESOURCES[kind].detail(id)
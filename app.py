@@ -3,13 +3,25 @@
 # ----------------------------------------------------------------------------#
 
 
+import hashlib
 import logging
+from datetime import timedelta
+from functools import lru_cache, wraps
 from logging import Formatter, FileHandler
 import babel
+import babel.dates
 import dateutil.parser
-from flask import Flask, render_template, request, flash, redirect, url_for, Markup, jsonify, json
+from flask import Flask, render_template, request, flash, redirect, url_for, Markup, jsonify, json, \
+    make_response, session, Response, stream_with_context
 from flask_moment import Moment
 from models import *
+from cache import PageCache, MemoryBackend, FileBackend
+from db_pool import engine_options, pool_stats
+from instrumentation import SQLInstrumentation
+from metrics import Metrics
+from bulk import EXPORTERS, EXPORT_FORMATS, book_tour
+from api import api
+from commands import summary_cli, import_cli, export_cli, purge_command, purge_pending_command, book_tour_command
 
 
 # ----------------------------------------------------------------------------#
@@ -20,8 +32,21 @@ from models import *
 app = Flask(__name__)
 app.config.from_object('config')
 moment = Moment(app)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
 db.init_app(app)
 migrate.init_app(app)
+sql_instrumentation = SQLInstrumentation(app)
+search_cache.configure(
+    maxsize=app.config.get('SEARCH_CACHE_SIZE'),
+    ttl=app.config.get('SEARCH_CACHE_TTL')
+)
+app.register_blueprint(api)
+app.cli.add_command(summary_cli)
+app.cli.add_command(import_cli)
+app.cli.add_command(export_cli)
+app.cli.add_command(purge_command)
+app.cli.add_command(purge_pending_command)
+app.cli.add_command(book_tour_command)
 
 
 # ----------------------------------------------------------------------------#
@@ -42,13 +67,13 @@ def ACTION_FAILED(model_name, action, name=None):
     )
 
 
-def SHOW_CONFLICT_ERROR(artist, venue, show):
+def SHOW_CONFLICT_ERROR(show):
     return Markup(
         f"""There is already a show by
-        <a href="{url_for("show_artist", artist_id=artist.id)}">{artist.name}</a>
-        in <a href="{url_for("show_venue", venue_id=venue.id)}">{venue.name}</a>
-        at {show.start_time}. You have to wait
-        for it to end to post a new show."""
+        <a href="{url_for("show_artist", artist_id=show.artist_id)}">{show.artist.name}</a>
+        in <a href="{url_for("show_venue", venue_id=show.venue_id)}">{show.venue.name}</a>
+        from {format_datetime(show.start_time, 'full')} to {format_datetime(show.end_time, 'full')}.
+        A venue can host, and an artist can play, one show at a time."""
     )
 
 
@@ -60,18 +85,205 @@ FORM_VALIDATION_FAILED = "You have a problem with some of these fields."
 # ----------------------------------------------------------------------------#
 
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma"
+}
+
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format, locale):
+    # babel parses the pattern and loads the locale data on every format_datetime call
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), babel.Locale.parse(locale)
+
+
+@lru_cache(maxsize=4096)
+def format_cached_datetime(value, format, locale):
+    pattern, locale = datetime_pattern(format, locale)
+    return pattern.apply(value, locale)
+
+
+def format_datetime(value, format='medium', locale=babel.dates.LC_TIME):
+    # datetime objects are formatted directly, strings are still parsed for older callers
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    return format_cached_datetime(value, format, locale)
 
 
 app.jinja_env.filters['datetime'] = format_datetime
 
 
+# ----------------------------------------------------------------------------#
+# Conditional Requests.
+# ----------------------------------------------------------------------------#
+
+
+def entity_tag(*values):
+    return hashlib.sha1(repr((app.config.get('ETAG_VERSION'),) + values).encode()).hexdigest()
+
+
+def conditional_response(etag, render):
+    """
+    (1) Answers 304 Not Modified when the client already holds this version of the page
+    (2) Otherwise renders the page through `render` and attaches its validator
+    :param etag: (str) validator of the data the page is rendered from
+    :param render: (callable) returns the full response
+    """
+
+    # pages carrying flashed messages differ from the page the validator describes
+    if session.get('_flashes'):
+        return render()
+
+    # no Last-Modified: deleted shows and shows turning past change a page without
+    # moving any updated_at, the entity tags cover them through the counts they hash
+    fresh = request.if_none_match.contains_weak(etag)
+    response = make_response('', 304) if fresh else make_response(render())
+
+    if response.status_code in (200, 304):
+        response.set_etag(etag, weak=True)
+        response.cache_control.no_cache = True
+        g.page_etag = etag
+
+    return response
+
+
+# ----------------------------------------------------------------------------#
+# Page Cache.
+# ----------------------------------------------------------------------------#
+
+
+page_cache = PageCache(
+    backend=FileBackend(app.config.get('PAGE_CACHE_DIR'), maxsize=app.config.get('PAGE_CACHE_SIZE'))
+    if app.config.get('PAGE_CACHE_BACKEND') == 'file'
+    else MemoryBackend(maxsize=app.config.get('PAGE_CACHE_SIZE')),
+    ttl=app.config.get('PAGE_CACHE_TTL')
+)
+
+
+def tag_page(*tags):
+    # tags name the data a cached page was rendered from, see `invalidate_page_cache`
+    if 'page_tags' in g:
+        g.page_tags.update(tags)
+
+
+def expire_page_at(moment):
+    # pages that split shows into past and upcoming go stale when the next show starts
+    if moment is not None and 'page_tags' in g:
+        g.page_expires = min(g.get('page_expires') or moment, moment)
+
+
+def cached_page(view):
+    """
+    (1) Serves a GET view from the page cache when its tags have not changed since it was stored
+    (2) Otherwise renders it and stores it with the tags collected through `tag_page`,
+        unless something was invalidated while it rendered
+    """
+
+    @wraps(view)
+    def wrapper(**kwargs):
+
+        # pages carrying flashed messages are one-offs, never serve or store them
+        if request.method != 'GET' or session.get('_flashes'):
+            return view(**kwargs)
+
+        key = request.full_path
+        entry = page_cache.get(key)
+
+        if entry is not None:
+            body, etag = entry
+
+            if etag:
+                return conditional_response(etag, lambda: body)
+
+            return body
+
+        # read before the view runs its queries, a write committed while it renders keeps the page out
+        generation = page_cache.generation()
+        g.page_tags = {'pages'}
+        response = make_response(view(**kwargs))
+
+        # a replica may not have the rows of a write invalidated moments ago, the page
+        # would be stored under the new versions, only the primary's are stored then
+        if response.status_code == 200 and not db.router.may_be_stale(page_cache.invalidated_at()):
+            page_cache.set(
+                key,
+                (response.get_data(as_text=True), g.get('page_etag')),
+                g.page_tags,
+                ttl=(g.page_expires - request_now()).total_seconds() if g.get('page_expires') else None,
+                generation=generation
+            )
+
+        return response
+
+    return wrapper
+
+
+@DBActions.exception_handler.listen
+def invalidate_page_cache(cls, action, **kwargs):
+    objects = [om for om in [kwargs.get('object_model'), *(kwargs.get('object_models') or ())] if om is not None]
+    shows = [om for om in objects if isinstance(om, Show)]
+    tags = set()
+
+    # a new show only changes its own venue, artist and the venue's area on /venues,
+    # the venue and artist passed along with it are just the other sides of the relationship
+    if shows:
+        tags.add('shows')
+
+        for show in shows:
+            tags.update((
+                f"venue:{show.venue_id}",
+                f"artist:{show.artist_id}",
+                f"area:{show.venue.state.name}:{show.venue.city}"
+            ))
+
+    else:
+        for om in objects:
+            if isinstance(om, Venue):
+                tags.update((f"venue:{om.id}", 'venues', 'shows'))
+
+            elif isinstance(om, Artist):
+                tags.update((f"artist:{om.id}", 'artists', 'shows'))
+
+    if issubclass(cls, ShowsSummary):
+        tags.add('venues')
+
+    # a removed or purged profile takes its shows along, and with them
+    # the counts of the other side's profiles on /venues and /artists
+    if action == 'remove' and any(isinstance(om, Profile) for om in objects):
+        tags.update(('venues', 'artists'))
+
+    # bulk imports don't say what they touched, neither do bookings whose shows
+    # could not be loaded after the commit, drop every page
+    if action == 'import' or action == 'book' and not shows:
+        tags.add('pages')
+
+    page_cache.invalidate(*tags)
+
+
+# ----------------------------------------------------------------------------#
+# Metrics.
+# ----------------------------------------------------------------------------#
+
+
+metrics = Metrics(
+    app,
+    engines=lambda: {
+        "primary": db.engine,
+        **{bind: db.get_engine(app, bind=bind) for bind in db.router.binds}
+    },
+    caches={
+        "page": page_cache,
+        "search": search_cache
+    }
+)
+
+
+@DBActions.exception_handler.on_failure
+def report_db_action_failure(cls, action, operation, error):
+    metrics.count_failure(cls, action, operation, error)
+    app.logger.error(f"{cls.__name__}.{action} failed and was rolled back", exc_info=error)
+
+
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
@@ -100,29 +312,46 @@ def index():
 #  # Venues Index.
 #    --------------------------------------------------------------
 @app.route('/venues')
+@cached_page
 def venues():
     """
     (1) Creates a route for Venues index view grouped by common cities
     :return: rendered HTML view for 'Venues' page
     """
 
-    # fetch all minimized venues data and grouping it
-    data = Venue.group_by_common(
-        Venue.get_all(
-            loadonly=db.load_only(
-                Venue.id,
-                Venue.name,
-                Venue.city,
-                Venue.state
-            )
+    # fetch one page of minimized venues data with their shows counts in one grouped query,
+    # ordered by area so it can be grouped in a single streaming pass
+    page = Venue.get_page(
+        query=Venue.counted_query(),
+        sort_keys=(
+            Venue.state,
+            Venue.city,
+            Venue.name,
+            Venue.id
         ),
-        ('city', 'state'),
-        'venues'
+        cursor=request.args.get('cursor'),
+        per_page=request.args.get('per_page', type=int)
     )
 
     # check if data is valid or exist
-    if data:  # this returns True or False depending on query status
-        return render_template('pages/venues.html', areas=data)
+    if page:  # this returns False on a failed query
+        areas = list(
+            Venue.iter_group_by_common(
+                page.get('data'),
+                ('city', 'state'),
+                'venues',
+                presorted=True
+            )
+        )
+
+        # a new show only clears the cached pages listing its venue's area
+        tag_page('venues', *(f"area:{area.get('state').name}:{area.get('city')}" for area in areas))
+        expire_page_at(min((v.next_show_time for v in page.get('data') if v.next_show_time), default=None))
+
+        return conditional_response(
+            entity_tag(page.get('cursor'), page.get('next_cursor'), *map(tuple, page.get('data'))),
+            lambda: render_template('pages/venues.html', areas=areas, page=page)
+        )
 
     else:
         return render_template("errors/500.html"), 500
@@ -131,23 +360,32 @@ def venues():
 #  # Artists index.
 #    --------------------------------------------------------------
 @app.route('/artists')
+@cached_page
 def artists():
     """
     (1) Creates a route for Artists index view
     :return: rendered HTML view for 'Artists' page
     """
 
-    # fetch all minimized artists data
-    data = Artist.get_all(
-        loadonly=db.load_only(
-            Artist.id,
-            Artist.name
-        )
+    # fetch one page of minimized artists data with their shows counts in one grouped query
+    page = Artist.get_page(
+        query=Artist.counted_query(),
+        sort_keys=(
+            Artist.name,
+            Artist.id
+        ),
+        cursor=request.args.get('cursor'),
+        per_page=request.args.get('per_page', type=int)
     )
 
     # check if data is valid or exist
-    if data:
-        return render_template('pages/artists.html', artists=data)
+    if page:
+        tag_page('artists')
+
+        return conditional_response(
+            entity_tag(page.get('cursor'), page.get('next_cursor'), *map(tuple, page.get('data'))),
+            lambda: render_template('pages/artists.html', artists=page.get('data'), page=page)
+        )
 
     else:
         return render_template("errors/500.html"), 500
@@ -156,18 +394,32 @@ def artists():
 #  # Shows index.
 #    --------------------------------------------------------------
 @app.route('/shows')
+@cached_page
 def shows():
     """
     (1) Creates a route for Shows index view
     :return: rendered HTML view for 'Shows' page
     """
 
-    # fetch all shows data
-    data = Show.get_all()
+    # fetch one page of shows cards data with their artists and venues in one joined query
+    page = Show.get_page(
+        query=Show.listing_query(),
+        sort_keys=(
+            Show.start_time,
+            Show.id
+        ),
+        cursor=request.args.get('cursor'),
+        per_page=request.args.get('per_page', type=int)
+    )
 
     # check if data is valid or exist
-    if data:
-        return render_template('pages/shows.html', shows=data)
+    if page:
+        tag_page('shows')
+
+        return conditional_response(
+            entity_tag(page.get('cursor'), page.get('next_cursor'), *map(tuple, page.get('data'))),
+            lambda: render_template('pages/shows.html', shows=page.get('data'), page=page)
+        )
 
     else:
         return render_template("errors/500.html"), 500
@@ -179,6 +431,7 @@ def shows():
 #  # Venue Profile.
 #    --------------------------------------------------------------
 @app.route('/profile/venue/<int:venue_id>')
+@cached_page
 def show_venue(venue_id):
     """
     (1) Creates a route for Venue profile view wih whole information related
@@ -186,11 +439,41 @@ def show_venue(venue_id):
     :return: rendered HTML view for 'Venue' page
     """
 
+    # fetch the venue version in one aggregate query, a client already holding it gets a 304
+    # without the venue or its shows being loaded
+    version = Venue.get_version(id=venue_id)
+
+    if version:
+        return conditional_response(
+            entity_tag(request.path, *version),
+            lambda: render_venue(venue_id)
+        )
+
+    else:
+        return render_template('errors/404.html'), 404
+
+
+def render_venue(venue_id):
+    """
+    (1) Renders the Venue profile page with whole information related
+    :param venue_id: (int) for get_one function to fetch data
+    :return: rendered HTML view for 'Venue' page
+    """
+
     # fetch one venue data by its id
     venue = Venue.get_one(id=venue_id)
 
     # check if data is valid or exist
     if venue:
+        upcoming_shows = venue.upcoming_shows
+
+        # the page also renders the artist of every show
+        tag_page(
+            f"venue:{venue.id}",
+            *(f"artist:{show.artist_id}" for show in upcoming_shows + venue.past_shows)
+        )
+        expire_page_at(upcoming_shows[0].start_time if upcoming_shows else None)
+
         return render_template('pages/show_venue.html', venue=venue)
 
     else:
@@ -200,6 +483,7 @@ def show_venue(venue_id):
 #  # Artist Profile.
 #    --------------------------------------------------------------
 @app.route('/profile/artist/<int:artist_id>')
+@cached_page
 def show_artist(artist_id):
     """
     (1) Creates a route for Artist profile view wih whole information related
@@ -207,11 +491,41 @@ def show_artist(artist_id):
     :return: rendered HTML view for 'Artist' page
     """
 
+    # fetch the artist version in one aggregate query, a client already holding it gets a 304
+    # without the artist or its shows being loaded
+    version = Artist.get_version(id=artist_id)
+
+    if version:
+        return conditional_response(
+            entity_tag(request.path, *version),
+            lambda: render_artist(artist_id)
+        )
+
+    else:
+        return render_template('errors/404.html'), 404
+
+
+def render_artist(artist_id):
+    """
+    (1) Renders the Artist profile page with whole information related
+    :param artist_id: (int) for get_one function to fetch data
+    :return: rendered HTML view for 'Artist' page
+    """
+
     # fetch one artist data by its id
     artist = Artist.get_one(id=artist_id)
 
     # check if data is valid or exist
     if artist:
+        upcoming_shows = artist.upcoming_shows
+
+        # the page also renders the venue of every show
+        tag_page(
+            f"artist:{artist.id}",
+            *(f"venue:{show.venue_id}" for show in upcoming_shows + artist.past_shows)
+        )
+        expire_page_at(upcoming_shows[0].start_time if upcoming_shows else None)
+
         return render_template('pages/show_artist.html', artist=artist)
 
     else:
@@ -397,15 +711,21 @@ def create_show():
             # create a new show instance
             show = Show()
 
-            # check if there is already a show at time before the submitted show
-            if db.session.query(Show).filter(
-                    Show.venue_id == venue.id,
-                    Show.artist_id == artist.id,
-                    Show.start_time >= datetime.now()
-            ).scalar() is not None:
+            # the show holds the venue and the artist from its start to its end
+            booking = {
+                'venue_id': venue.id,
+                'artist_id': artist.id,
+                'start_time': form.start_time.data,
+                'end_time': form.start_time.data + timedelta(minutes=form.duration.data)
+            }
+
+            # look for a show overlapping it at the same venue or with the same artist
+            conflict = Show.get_conflict(**booking)
+
+            if conflict:
 
                 flash(
-                    SHOW_CONFLICT_ERROR(artist, venue, Show.query.filter(Show.start_time >= datetime.now()).first()),
+                    SHOW_CONFLICT_ERROR(conflict),
                     category="alert-warning"
                 )
 
@@ -416,7 +736,8 @@ def create_show():
                         object_models=[show, artist, venue],
                         identifiers=['s', 'a', 'v'],
                         s=[
-                            ('start_time', form.start_time.data),
+                            ('start_time', booking.get('start_time')),
+                            ('end_time', booking.get('end_time')),
                             ('artist', artist),
                             ('venue', venue)
                         ],
@@ -435,9 +756,13 @@ def create_show():
 
                 else:
 
+                    # a concurrent booking may have taken the time since the check,
+                    # then the exclusion constraints rejected this one, which a replica may not show yet
+                    conflict = Show.get_conflict(on_primary=True, **booking)
+
                     flash(
-                        ACTION_FAILED('show', 'failed'),
-                        category="alert-danger"
+                        SHOW_CONFLICT_ERROR(conflict) if conflict else ACTION_FAILED('show', 'failed'),
+                        category="alert-warning" if conflict else "alert-danger"
                     )
 
         else:
@@ -452,6 +777,46 @@ def create_show():
         return render_template('pages/home.html')
 
 
+#  # Book a Tour.
+#    --------------------------------------------------------------
+@app.route('/shows/batch', methods=['POST'])
+def create_shows_batch():
+    """
+    (1) Creates an Endpoint booking a whole tour of shows at once
+    :return(POST): json response including
+                   'status': 'succeeded' when every show was created,
+                             'partial' when some were, 'failed' otherwise,
+                   'created': the number of shows created,
+                   'results': one result per entry, in order, see `bulk.book_tour`.
+                   The request body is {"shows": [{"artist_id", "venue_id",
+                   "start_time", "duration" or "end_time"}, ...], "atomic": false},
+                   with "atomic" no show is created unless all of them can be.
+    """
+
+    # load data from request, whatever its content type
+    booking_data = request.get_json(force=True, silent=True)
+
+    if not isinstance(booking_data, dict):
+        return jsonify(status='failed', error="the body has to be a JSON object holding 'shows'"), 400
+
+    shows = booking_data.get("shows")
+
+    if not isinstance(shows, list) or not shows or len(shows) > app.config.get('TOUR_MAX_SHOWS', 500):
+        return jsonify(
+            status='failed',
+            error=f"'shows' has to be a list of 1 to {app.config.get('TOUR_MAX_SHOWS', 500)} entries"
+        ), 400
+
+    results = book_tour(shows, atomic=bool(booking_data.get("atomic")))
+    created = sum(r.get('status') == 'created' for r in results)
+
+    return jsonify(
+        status='succeeded' if created == len(results) else 'partial' if created else 'failed',
+        created=created,
+        results=results
+    ), 201 if created else 422
+
+
 #  Editing Endpoints
 #  ----------------------------------------------------------------
 
@@ -659,11 +1024,12 @@ def search_venues():
     """
 
     # load data from request
-    search_term = json.loads(request.data).get("search_term")
+    search_data = json.loads(request.data)
+    search_term = search_data.get("search_term")
 
-    # run search operation on Venue table and store results in response var,
-    # see `models.py` for details.
-    response = Venue.search(keyword=search_term)
+    # run a ranked, limited search operation on Venue table and store results in response var,
+    # a limit that is not a positive whole number gets a 400, see `models.py` for details.
+    response = Venue.search(keyword=search_term, limit=Venue.parse_limit(search_data.get("limit")))
 
     # check if there are any results
     if response.get('results'):
@@ -686,11 +1052,12 @@ def search_artists():
     """
 
     # load data from request
-    search_term = json.loads(request.data).get("search_term")
+    search_data = json.loads(request.data)
+    search_term = search_data.get("search_term")
 
-    # run search operation on Artist table and store results in response var,
-    # see `models.py` for details.
-    response = Artist.search(keyword=search_term)
+    # run a ranked, limited search operation on Artist table and store results in response var,
+    # a limit that is not a positive whole number gets a 400, see `models.py` for details.
+    response = Artist.search(keyword=search_term, limit=Artist.parse_limit(search_data.get("limit")))
 
     # check if there are any results
     if response.get('results'):
@@ -700,6 +1067,12 @@ def search_artists():
         return jsonify(response), 404
 
 
+def should_purge_later(profile):
+    # deleting thousands of shows inside the request would hold the worker up
+    threshold = app.config.get('PURGE_ASYNC_THRESHOLD')
+    return bool(threshold) and profile.past_shows_count + profile.upcoming_shows_count > threshold
+
+
 #  # Delete Venue.
 #    --------------------------------------------------------------
 @app.route('/venues/<venue_id>/delete', methods=['GET', 'DELETE'])
@@ -729,6 +1102,7 @@ def delete_venue(venue_id):
             # see `models.py` for details.
             response = Venue.delete_ajaxly(
                 object_model=venue,
+                purge_later=should_purge_later(venue),
                 redir1=url_for("venues"),  # redirection link on success
                 redir2=url_for("show_venue", venue_id=venue_id)  # redirection link on failure
             )
@@ -743,6 +1117,13 @@ def delete_venue(venue_id):
                     category="alert-success"
                 )
 
+            elif response.get("status") == "scheduled":
+
+                flash(
+                    ACTION_SUCCEEDED('venue', 'scheduled for deletion', name=response.get('name')),
+                    category="alert-success"
+                )
+
             elif response.get("status") == "failed":
 
                 flash(
@@ -786,6 +1167,7 @@ def delete_artist(artist_id):
             # see `models.py` for details.
             response = Artist.delete_ajaxly(
                 object_model=artist,
+                purge_later=should_purge_later(artist),
                 redir1=url_for("artists"),
                 redir2=url_for("show_artist", artist_id=artist_id)
             )
@@ -800,6 +1182,13 @@ def delete_artist(artist_id):
                     category="alert-success"
                 )
 
+            elif response.get("status") == "scheduled":
+
+                flash(
+                    ACTION_SUCCEEDED('artist', 'scheduled for deletion', name=response.get('name')),
+                    category="alert-success"
+                )
+
             elif response.get("status") == "failed":
 
                 flash(
@@ -814,11 +1203,116 @@ def delete_artist(artist_id):
         return render_template("errors/404.html"), 404
 
 
+#  Export Endpoints
+#  ----------------------------------------------------------------
+@app.route('/export/<kind>')
+def export(kind):
+    """
+    (1) Creates an Endpoint streaming every venue, artist or show as CSV or
+        NDJSON, rows are read from a server-side cursor a batch at a time
+    :param kind: (str) 'venues', 'artists' or 'shows'
+    :return: streamed 'text/csv' or 'application/x-ndjson' response,
+             `?format=csv|ndjson` picks the format (csv by default)
+             and `?fields=id,name,...` the columns.
+             Go to `bulk.py` file to see details about the exporters.
+    """
+
+    format = request.args.get('format', 'csv')
+
+    if kind not in EXPORTERS or format not in EXPORT_FORMATS:
+        return render_template("errors/404.html"), 404
+
+    try:
+        exporter = EXPORTERS[kind](fields=[f for f in request.args.get('fields', '').split(',') if f])
+
+    except ValueError as error:
+        return jsonify(status='failed', error=str(error)), 400
+
+    # exports are reads, so they are served from a replica when there is one
+    engine = db.get_engine(app, bind=db.router.choose(lambda bind: db.get_engine(app, bind=bind)))
+
+    def generate():
+        with engine.connect() as connection:
+            yield from getattr(exporter, format)(connection)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename={kind}.{format}"}
+    )
+
+
+#  Status Endpoints
+#  ----------------------------------------------------------------
+
+
+#  # Connection Pool Status.
+#    --------------------------------------------------------------
+@app.route('/status/pool')
+def status_pool():
+    """
+    (1) Creates an Endpoint for this worker's database connection pool metrics
+    :return: json response including
+             'pool', 'size', 'overflow', 'in_use', 'checkouts', 'connects',
+             'overflows', 'timeouts', 'invalidations' and checkout wait times
+             in seconds. Go to `db_pool.py` file for details.
+    """
+    return jsonify(pool_stats(db.engine))
+
+
+#  # Read Replicas Status.
+#    --------------------------------------------------------------
+@app.route('/status/replicas')
+def status_replicas():
+    """
+    (1) Creates an Endpoint for this worker's read routing
+    :return: json response including
+             'routed': transactions routed to the primary and each replica,
+             'lags': each replica's last measured lag in seconds,
+             'pools': each replica's connection pool metrics.
+             Go to `routing.py` file for details.
+    """
+    return jsonify(
+        **db.router.stats(),
+        pools={bind: pool_stats(db.get_engine(app, bind=bind)) for bind in db.router.binds}
+    )
+
+
+#  # Metrics.
+#    --------------------------------------------------------------
+@app.route('/metrics')
+def status_metrics():
+    """
+    (1) Creates an Endpoint for Prometheus to scrape, summed over all the
+        workers when PROMETHEUS_MULTIPROC_DIR is set
+    :return: text response including
+             request latency histograms by endpoint, method and status,
+             template render time histograms, failed DBActions operations,
+             connection pool and cache counters and gauges.
+             Go to `metrics.py` file for details.
+    """
+    if not metrics.enabled:
+        return jsonify(status='failed', error='metrics are disabled, is prometheus_client installed?'), 404
+
+    body, content_type = metrics.exposition()
+    return Response(body, content_type=content_type)
+
+
 # ----------------------------------------------------------------------------#
 # Error Handlers.
 # ----------------------------------------------------------------------------#
 
 
+@app.errorhandler(400)
+@app.errorhandler(InvalidArgument)
+def bad_request_error(error):
+    # ajax endpoints get the reason back as json
+    if request.is_json:
+        return jsonify(status='failed', error=str(getattr(error, 'description', error))), 400
+
+    return render_template('errors/400.html'), 400
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
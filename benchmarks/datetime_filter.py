@@ -0,0 +1,59 @@
+"""
+Compares the per-card cost of the `datetime` Jinja filter on a page of
+show cards, the way the templates used it before (`|string|datetime`,
+a string round trip through dateutil and a full babel format_datetime
+call) against the current filter taking the datetime directly.
+
+    python benchmarks/datetime_filter.py [--shows 1000] [--repeat 20]
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import format_datetime, format_cached_datetime  # noqa: E402
+
+
+def legacy_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # shows an hour apart, as on a busy /shows page
+    start = datetime(2026, 1, 1, 20, 0)
+    times = [start + timedelta(hours=i) for i in range(args.shows)]
+
+    runs = {
+        "before (|string|datetime)": lambda: [legacy_format_datetime(str(t), 'full') for t in times],
+        "after, cold cache": lambda: (
+            format_cached_datetime.cache_clear(),
+            [format_datetime(t, 'full') for t in times]
+        ),
+        "after, warm cache": lambda: [format_datetime(t, 'full') for t in times],
+    }
+
+    for name, run in runs.items():
+        run()
+        best = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        print(f"{name:<28} {best * 1000:9.2f} ms/page {best / args.shows * 1e6:9.2f} us/card")
+
+
+if __name__ == '__main__':
+    main()
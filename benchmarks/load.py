@@ -0,0 +1,405 @@
+"""
+Replays a mix of index, profile, search and create traffic against the app
+and writes the latency percentiles, throughput and database query counts
+of every endpoint to a JSON file, to compare between commits:
+
+    python benchmarks/seed.py --venues 10000 --artists 100000 --shows 2000000 --reset
+    python benchmarks/load.py --requests 20000 --concurrency 8 --output before.json
+    git checkout my-branch
+    python benchmarks/load.py --requests 20000 --concurrency 8 --output after.json --compare before.json
+
+Requests go through the Flask test client in this process by default, or to
+a running server with --base-url. Either way the profile ids are read from
+the database in DATABASE_URL, so point it at the server's. The request
+sequence only depends on --seed, the create traffic books new shows, so
+reseed between runs that have to see the same data. Query counts come from
+the X-Query-Count header, cached pages run none.
+"""
+
+import argparse
+import json
+import os
+import queue
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from http.cookiejar import CookieJar
+from itertools import accumulate
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app import app  # noqa: E402
+from models import db, Venue, Artist, Show  # noqa: E402
+from seed import ADJECTIVES, NOUNS, zipf_weights, rng_for  # noqa: E402
+
+
+DEFAULT_MIX = "index=30,profile=40,search=20,create=10"
+
+CSRF_TOKEN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+# ----------------------------------------------------------------------------#
+# Traffic.
+# ----------------------------------------------------------------------------#
+
+
+class Traffic:
+    """
+    Builds the requests of each kind, as (endpoint, method, path, data, json)
+    tuples, endpoints are named after the app's views.
+    """
+
+    def __init__(self, rng, venues, artists):
+        self.rng = rng
+        self.venues = venues
+        self.artists = artists
+
+        # a few popular profiles get most of the visits, like the shows they play
+        self.venue_weights = list(accumulate(zipf_weights(venues)))
+        self.artist_weights = list(accumulate(zipf_weights(artists)))
+
+    def venue_id(self):
+        return self.rng.choices(range(1, self.venues + 1), cum_weights=self.venue_weights)[0]
+
+    def artist_id(self):
+        return self.rng.choices(range(1, self.artists + 1), cum_weights=self.artist_weights)[0]
+
+    def index(self):
+        kind = self.rng.choice(('venues', 'artists', 'shows'))
+        return kind, 'GET', f"/{kind}", None, None
+
+    def profile(self):
+        if self.rng.random() < 0.5:
+            return 'show_venue', 'GET', f"/profile/venue/{self.venue_id()}", None, None
+
+        return 'show_artist', 'GET', f"/profile/artist/{self.artist_id()}", None, None
+
+    def search(self):
+        kind = self.rng.choice(('venues', 'artists'))
+        adjective, noun = self.rng.choice(ADJECTIVES), self.rng.choice(NOUNS)
+
+        # what people type: the first letters, a word, or most of a name
+        term = self.rng.choice((adjective[:2], adjective, f"{adjective} {noun}"))
+
+        return f"search_{kind}", 'POST', f"/{kind}/search", None, {"search_term": term}
+
+    def create(self):
+        # far enough ahead to miss the seeded shows, a clash is still reported, not an error
+        start_time = datetime.now().replace(minute=0, second=0, microsecond=0) + timedelta(
+            days=self.rng.randint(3 * 365, 10 * 365), hours=self.rng.randint(0, 23)
+        )
+
+        return 'create_show', 'POST', '/shows/create', {
+            "venue_id": str(self.venue_id()),
+            "artist_id": str(self.artist_id()),
+            "start_time": start_time.strftime('%Y-%m-%d %H:%M:%S'),
+            "duration": "120"
+        }, None
+
+    def requests(self, mix, count):
+        kinds, weights = zip(*mix.items())
+
+        for kind in self.rng.choices(kinds, weights=weights, k=count):
+            yield getattr(self, kind)()
+
+
+def parse_mix(value):
+    mix = {}
+
+    for part in value.split(','):
+        kind, _, weight = part.partition('=')
+
+        if kind.strip() not in ('index', 'profile', 'search', 'create'):
+            raise argparse.ArgumentTypeError(f"unknown traffic kind {kind.strip()!r}")
+
+        mix[kind.strip()] = float(weight)
+
+    return mix
+
+
+# ----------------------------------------------------------------------------#
+# Targets.
+# ----------------------------------------------------------------------------#
+
+
+class AppTarget:
+    # the test client runs the whole app, templates included, without a network hop
+
+    name = "test client"
+
+    def __init__(self):
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.local = threading.local()
+
+    def send(self, method, path, data=None, json_body=None):
+        if not hasattr(self.local, 'client'):
+            self.local.client = app.test_client()
+
+        response = self.local.client.open(path, method=method, data=data, json=json_body)
+        response.get_data()
+
+        return response.status_code, response.headers.get('X-Query-Count')
+
+
+class HTTPTarget:
+
+    def __init__(self, base_url):
+        self.name = base_url
+        self.base_url = base_url.rstrip('/')
+        self.local = threading.local()
+
+    def opener(self):
+        # one cookie jar per worker, the CSRF token is bound to the session cookie
+        if not hasattr(self.local, 'opener'):
+            self.local.opener = build_opener(HTTPCookieProcessor(CookieJar()))
+            self.local.tokens = {}
+
+        return self.local.opener
+
+    def csrf_token(self, path):
+        if path not in self.local.tokens:
+            with self.opener().open(self.base_url + path) as response:
+                match = CSRF_TOKEN.search(response.read().decode())
+
+            self.local.tokens[path] = match.group(1) if match else None
+
+        return self.local.tokens[path]
+
+    def send(self, method, path, data=None, json_body=None):
+        opener = self.opener()
+        headers = {}
+        body = None
+
+        if data is not None:
+            token = self.csrf_token(path)
+            body = urlencode({**data, **({"csrf_token": token} if token else {})}).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        elif json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+
+        try:
+            with opener.open(Request(self.base_url + path, data=body, headers=headers, method=method)) as response:
+                response.read()
+                return response.status, response.headers.get('X-Query-Count')
+
+        except HTTPError as error:
+            return error.code, error.headers.get('X-Query-Count')
+
+
+# ----------------------------------------------------------------------------#
+# Runner.
+# ----------------------------------------------------------------------------#
+
+
+def run(target, requests, concurrency):
+    """
+    (1) Sends the requests from `concurrency` worker threads
+    :return: the samples, (endpoint, status, milliseconds, query count)
+             tuples, and the wall time in seconds
+    """
+    pending = queue.Queue()
+    samples = []
+    lock = threading.Lock()
+
+    for request in requests:
+        pending.put(request)
+
+    def work():
+        while True:
+            try:
+                endpoint, method, path, data, json_body = pending.get_nowait()
+
+            except queue.Empty:
+                return
+
+            started = time.perf_counter()
+
+            try:
+                status, queries = target.send(method, path, data=data, json_body=json_body)
+
+            except Exception as error:
+                status, queries = type(error).__name__, None
+
+            elapsed = (time.perf_counter() - started) * 1000
+
+            with lock:
+                samples.append((endpoint, status, elapsed, int(queries) if queries is not None else None))
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=work) for _ in range(concurrency)]
+
+    for worker in workers:
+        worker.start()
+
+    for worker in workers:
+        worker.join()
+
+    return samples, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    # nearest rank
+    ordered = sorted(values)
+    return ordered[max(int(round(fraction * len(ordered) + 0.5)) - 1, 0)] if ordered else None
+
+
+def summarize(samples, wall):
+    latencies = [ms for endpoint, status, ms, queries in samples]
+    queries = [q for endpoint, status, ms, q in samples if q is not None]
+    statuses = defaultdict(int)
+
+    for endpoint, status, ms, q in samples:
+        statuses[str(status)] += 1
+
+    return {
+        "requests": len(samples),
+        "errors": sum(
+            count for status, count in statuses.items() if not status.isdigit() or int(status) >= 500
+        ),
+        "statuses": dict(sorted(statuses.items())),
+        "throughput_rps": round(len(samples) / wall, 2) if wall else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 3),
+            "p95": round(percentile(latencies, 0.95), 3),
+            "p99": round(percentile(latencies, 0.99), 3),
+            "mean": round(sum(latencies) / len(latencies), 3),
+            "max": round(max(latencies), 3)
+        },
+        "queries": {
+            "mean": round(sum(queries) / len(queries), 3),
+            "p95": percentile(queries, 0.95),
+            "max": max(queries)
+        } if queries else None
+    }
+
+
+def report(samples, wall, meta):
+    by_endpoint = defaultdict(list)
+
+    for sample in samples:
+        by_endpoint[sample[0]].append(sample)
+
+    return {
+        "meta": meta,
+        "overall": summarize(samples, wall),
+        "endpoints": {endpoint: summarize(s, wall) for endpoint, s in sorted(by_endpoint.items())}
+    }
+
+
+def compare(old, new):
+    rows = [("endpoint", "p50 ms", "p95 ms", "p99 ms", "rps", "queries")]
+
+    def change(before, after):
+        if before in (None, 0) or after is None:
+            return f"{after}"
+
+        return f"{before:g} -> {after:g} ({(after - before) / before:+.0%})"
+
+    for endpoint in ["overall", *sorted(set(old.get('endpoints')) | set(new.get('endpoints')))]:
+        before = old.get('overall') if endpoint == "overall" else old.get('endpoints').get(endpoint)
+        after = new.get('overall') if endpoint == "overall" else new.get('endpoints').get(endpoint)
+
+        if not before or not after:
+            rows.append((endpoint, "only in one run", "", "", "", ""))
+            continue
+
+        rows.append((
+            endpoint,
+            *(change(before['latency_ms'][p], after['latency_ms'][p]) for p in ('p50', 'p95', 'p99')),
+            change(before['throughput_rps'], after['throughput_rps']),
+            change((before.get('queries') or {}).get('mean'), (after.get('queries') or {}).get('mean'))
+        ))
+
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+
+    for row in rows:
+        print("  ".join(str(value).ljust(width) for value, width in zip(row, widths)))
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+        dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT))
+        return commit, dirty
+
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200, help="Requests sent first and left out of the report.")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"Weights of each kind of traffic, {DEFAULT_MIX} by default.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--base-url", default=None, help="A running server, the in-process test client by default.")
+    parser.add_argument("--output", default=None, help="The report file, load-<commit>.json by default.")
+    parser.add_argument("--compare", default=None, help="An earlier report to print the differences with.")
+    args = parser.parse_args()
+
+    with app.app_context():
+        rows = {
+            model.__tablename__.lower() + "s": db.session.query(db.func.count(model.id)).scalar()
+            for model in (Venue, Artist, Show)
+        }
+        venues = db.session.query(db.func.max(Venue.id)).scalar() or 0
+        artists = db.session.query(db.func.max(Artist.id)).scalar() or 0
+        db.session.remove()
+
+    if not venues or not artists:
+        raise SystemExit("There are no venues or artists to visit, seed the database first.")
+
+    target = HTTPTarget(args.base_url) if args.base_url else AppTarget()
+    traffic = Traffic(rng_for(args.seed, 'load'), venues, artists)
+    commit, dirty = git_commit()
+
+    run(target, list(traffic.requests(args.mix, args.warmup)), args.concurrency)
+
+    started_at = datetime.now().isoformat(timespec='seconds')
+    samples, wall = run(target, list(traffic.requests(args.mix, args.requests)), args.concurrency)
+
+    result = report(samples, wall, {
+        "commit": commit,
+        "dirty": dirty,
+        "started_at": started_at,
+        "target": target.name,
+        "requests": args.requests,
+        "warmup": args.warmup,
+        "concurrency": args.concurrency,
+        "mix": args.mix,
+        "seed": args.seed,
+        "wall_s": round(wall, 3),
+        "rows": rows
+    })
+
+    output = args.output or f"load-{(commit or 'unknown')[:10]}.json"
+
+    with open(output, 'w') as file:
+        json.dump(result, file, indent=2)
+
+    overall = result.get('overall')
+    print(
+        f"{overall['requests']} requests in {wall:.1f}s, {overall['throughput_rps']} req/s, "
+        f"p50 {overall['latency_ms']['p50']}ms, p95 {overall['latency_ms']['p95']}ms, "
+        f"p99 {overall['latency_ms']['p99']}ms, {overall['errors']} errors, written to {output}"
+    )
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(json.load(file), result)
+
+
+if __name__ == '__main__':
+    main()
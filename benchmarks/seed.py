@@ -0,0 +1,290 @@
+"""
+Fills the database with synthetic venues, artists and shows at any scale,
+e.g. production's:
+
+    python benchmarks/seed.py --venues 10000 --artists 100000 --shows 2000000 --reset
+
+The data only depends on the arguments, the same --seed and --anchor give
+the same rows, and changing the number of shows leaves the venues and
+artists as they were. Profiles are spread over the states by population
+and get one to three genres, weighted by popularity. A few venues and
+artists take most of the bookings (a Zipf distribution), shows start in
+the evening, more of them on Fridays and Saturdays, and fewer are booked
+the further ahead they are. No venue or artist plays twice on the same
+day, so the shows never overlap.
+
+The tables are emptied first (--reset is required when they hold rows),
+the rows are written with COPY through the `flask import` importers, and
+the shows summaries are rebuilt at the end.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate, product
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app  # noqa: E402
+from bulk import VenueImporter, ArtistImporter, ShowImporter  # noqa: E402
+from models import db, Venue, Artist, Show, VenueShowsSummary, ArtistShowsSummary, State, Genres  # noqa: E402
+
+
+# rough shares of the US population, in percent, the other states get 0.5
+STATE_WEIGHTS = {
+    'CA': 11.9, 'TX': 8.9, 'FL': 6.6, 'NY': 5.9, 'PA': 3.9, 'IL': 3.8, 'OH': 3.5, 'GA': 3.3,
+    'NC': 3.2, 'MI': 3.0, 'NJ': 2.8, 'VA': 2.6, 'WA': 2.3, 'AZ': 2.2, 'MA': 2.1, 'TN': 2.1,
+    'IN': 2.0, 'MO': 1.8, 'MD': 1.8, 'WI': 1.8, 'CO': 1.8, 'MN': 1.7, 'SC': 1.6, 'AL': 1.5,
+    'LA': 1.4, 'KY': 1.3, 'OR': 1.3, 'OK': 1.2, 'CT': 1.1, 'UT': 1.0, 'NV': 0.9, 'DC': 0.7
+}
+
+# biggest first, the first cities get most of the profiles
+CITIES = {
+    'CA': ('Los Angeles', 'San Francisco', 'San Diego', 'San Jose', 'Sacramento', 'Oakland'),
+    'TX': ('Houston', 'Austin', 'Dallas', 'San Antonio', 'Fort Worth', 'El Paso'),
+    'FL': ('Miami', 'Orlando', 'Tampa', 'Jacksonville', 'Tallahassee'),
+    'NY': ('New York', 'Brooklyn', 'Buffalo', 'Rochester', 'Albany'),
+    'PA': ('Philadelphia', 'Pittsburgh', 'Allentown'),
+    'IL': ('Chicago', 'Aurora', 'Springfield'),
+    'GA': ('Atlanta', 'Savannah', 'Athens'),
+    'WA': ('Seattle', 'Spokane', 'Tacoma'),
+    'TN': ('Nashville', 'Memphis', 'Knoxville'),
+    'LA': ('New Orleans', 'Baton Rouge', 'Lafayette'),
+    'CO': ('Denver', 'Boulder', 'Colorado Springs'),
+    'MA': ('Boston', 'Cambridge', 'Worcester'),
+    'OR': ('Portland', 'Eugene', 'Salem'),
+    'NV': ('Las Vegas', 'Reno'),
+    'DC': ('Washington',),
+}
+TOWNS = ('Springfield', 'Franklin', 'Greenville', 'Clinton', 'Madison', 'Georgetown', 'Salem')
+
+GENRE_WEIGHTS = {
+    'Rock_n_Roll': 14, 'Pop': 13, 'Hip_Hop': 12, 'Electronic': 9, 'R_and_B': 8, 'Country': 8,
+    'Jazz': 7, 'Alternative': 7, 'Folk': 5, 'Soul': 5, 'Blues': 4, 'Punk': 4,
+    'Heavy_Metal': 4, 'Funk': 3, 'Reggae': 3, 'Classical': 3, 'Instrumental': 2,
+    'Musical_Theatre': 2, 'Other': 1
+}
+
+ADJECTIVES = (
+    'Amber', 'Blue', 'Broken', 'Copper', 'Crimson', 'Electric', 'Golden', 'Hollow', 'Iron', 'Lonesome',
+    'Lunar', 'Midnight', 'Neon', 'Northern', 'Painted', 'Quiet', 'Rusty', 'Silver', 'Velvet', 'Wild'
+)
+NOUNS = (
+    'Anchor', 'Arrow', 'Canyon', 'Coyote', 'Crow', 'Echo', 'Ember', 'Falcon', 'Harbor', 'Lantern',
+    'Meadow', 'Owl', 'Pine', 'Raven', 'River', 'Rose', 'Sparrow', 'Thunder', 'Tide', 'Wolf'
+)
+VENUE_KINDS = ('Hall', 'Lounge', 'Club', 'Theater', 'Room', 'Tavern', 'Ballroom', 'Bar')
+ARTIST_KINDS = ('Band', 'Collective', 'Trio', 'Quartet', 'Orchestra', 'Project', 'Brothers', 'Sisters')
+
+# Monday first
+WEEKDAY_WEIGHTS = (0.6, 0.6, 0.8, 1.0, 1.6, 1.8, 1.2)
+START_HOURS = ((18, 1), (19, 3), (20, 4), (21, 3), (22, 1))
+DURATIONS = ((90, 3), (120, 5), (150, 2), (180, 1))
+
+
+def rng_for(seed, table):
+    # one stream per table, so the shows can be regenerated without changing the profiles
+    return random.Random(f"{seed}:{table}")
+
+
+def pick(rng, weighted):
+    values, weights = zip(*weighted)
+    return rng.choices(values, weights=weights)[0]
+
+
+def zipf_weights(count, exponent=0.9):
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def sample_distinct(rng, population, cum_weights, k):
+    """
+    (1) Draws k distinct members, the heavier ones more often
+    :return: (list) of k members of population, k has to be at most its size
+    """
+    chosen = {}
+
+    for _ in range(3):
+        for member in rng.choices(population, cum_weights=cum_weights, k=k - len(chosen)):
+            chosen.setdefault(member, None)
+
+        if len(chosen) == k:
+            return list(chosen)
+
+    # drawing the last few by weight takes long when k is close to the population size
+    rest = [member for member in population if member not in chosen]
+    return list(chosen) + rng.sample(rest, k - len(chosen))
+
+
+def profile_names(rng, kinds, count):
+    combinations = [" ".join(words) for words in product(ADJECTIVES, NOUNS, kinds)]
+    rng.shuffle(combinations)
+
+    for i in range(count):
+        name = combinations[i % len(combinations)]
+        yield name if i < len(combinations) else f"{name} {i // len(combinations) + 1}"
+
+
+def profile_rows(rng, kinds, count, venue=False):
+    states = [s for s in State.__members__]
+    state_weights = [STATE_WEIGHTS.get(s, 0.5) for s in states]
+    genres = [g for g in Genres.__members__ if g in GENRE_WEIGHTS]
+    genre_weights = [GENRE_WEIGHTS[g] for g in genres]
+
+    for i, name in enumerate(profile_names(rng, kinds, count)):
+        state = rng.choices(states, weights=state_weights)[0]
+        cities = CITIES.get(state, TOWNS)
+        slug = name.lower().replace(' ', '')
+        seeking = rng.random() < 0.2
+
+        row = {
+            "name": name,
+            "city": rng.choices(cities, weights=zipf_weights(len(cities), 1.2))[0],
+            "state": state,
+            "phone": f"{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}",
+            "genres": list(dict.fromkeys(
+                rng.choices(genres, weights=genre_weights, k=pick(rng, ((1, 6), (2, 3), (3, 1))))
+            )),
+            "website": f"https://www.{slug}.com" if rng.random() < 0.7 else None,
+            "facebook_link": f"https://www.facebook.com/{slug}" if rng.random() < 0.6 else None,
+            "seeking_description": "Looking for new faces, drop us a line." if seeking else None,
+            "seeking_talent" if venue else "seeking_venue": seeking,
+        }
+
+        if venue:
+            row["address"] = f"{rng.randint(1, 9999)} {rng.choice(NOUNS)} {rng.choice(('St', 'Ave', 'Blvd', 'Rd'))}"
+
+        yield i + 1, row
+
+
+def daily_counts(shows, days, first_day, future_from):
+    """
+    (1) Spreads the shows over the days by weekday, with the bookings
+        thinning out linearly to a fifth over the future days
+    :return: (list) of the number of shows of each day
+    """
+    future_days = max(days - future_from, 1)
+    weights = [
+        WEEKDAY_WEIGHTS[(first_day + timedelta(days=d)).weekday()]
+        * (1 if d < future_from else 1 - 0.8 * (d - future_from) / future_days)
+        for d in range(days)
+    ]
+    total = sum(weights)
+    shares = [shows * w / total for w in weights]
+    counts = [int(share) for share in shares]
+
+    # the rounding leftovers go to the days that lost the most
+    leftover = shows - sum(counts)
+    for d in sorted(range(days), key=lambda d: counts[d] - shares[d])[:leftover]:
+        counts[d] += 1
+
+    return counts
+
+
+def show_rows(rng, venues, artists, shows, anchor, past_days, future_days):
+    days = past_days + future_days
+    first_day = anchor - timedelta(days=past_days)
+
+    # popularity is by rank, the ranks are shuffled so popular profiles don't cluster at low ids
+    venue_ids = list(range(1, venues + 1))
+    artist_ids = list(range(1, artists + 1))
+    rng.shuffle(venue_ids)
+    rng.shuffle(artist_ids)
+    venue_weights = list(accumulate(zipf_weights(venues)))
+    artist_weights = list(accumulate(zipf_weights(artists)))
+
+    # a venue or an artist plays at most once a day
+    per_day = min(venues, artists)
+    line_num = 0
+
+    for d, count in enumerate(daily_counts(shows, days, first_day, past_days)):
+        count = min(count, per_day)
+        day = first_day + timedelta(days=d)
+
+        for venue_id, artist_id in zip(
+            sample_distinct(rng, venue_ids, venue_weights, count),
+            sample_distinct(rng, artist_ids, artist_weights, count)
+        ):
+            start_time = day.replace(hour=pick(rng, START_HOURS), minute=rng.choice((0, 30)))
+            line_num += 1
+
+            # the latest show ends at 1:30, before the earliest of the next day starts
+            yield line_num, {
+                "venue_id": venue_id,
+                "artist_id": artist_id,
+                "start_time": start_time,
+                "end_time": start_time + timedelta(minutes=pick(rng, DURATIONS))
+            }
+
+
+def run_import(importer_class, connection, rows, chunk_size, label):
+    started = time.monotonic()
+
+    def progress(report):
+        print(f"\r{label}: {report.imported} ({report.rate:.0f} rows/s)", end="", file=sys.stderr, flush=True)
+
+    report = importer_class(connection, chunk_size=chunk_size).run(rows, progress=progress)
+    print(f"\r{label}: {report.imported} in {time.monotonic() - started:.1f}s", file=sys.stderr)
+
+    if report.errors:
+        raise SystemExit(f"{len(report.errors)} {label} rejected, first: {report.errors[0]}")
+
+    return report.imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--venues", type=int, default=1000)
+    parser.add_argument("--artists", type=int, default=10000)
+    parser.add_argument("--shows", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--anchor", type=datetime.fromisoformat, default=None,
+                        help="The day splitting past and upcoming shows, today by default.")
+    parser.add_argument("--past-days", type=int, default=3 * 365)
+    parser.add_argument("--future-days", type=int, default=365)
+    parser.add_argument("--chunk-size", type=int, default=20000)
+    parser.add_argument("--reset", action="store_true", help="Empty the tables even when they hold rows.")
+    args = parser.parse_args()
+
+    anchor = (args.anchor or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    tables = [Show, Venue, Artist, VenueShowsSummary, ArtistShowsSummary]
+
+    with app.app_context():
+        connection = db.engine.connect()
+
+        if not args.reset and any(
+            connection.scalar(db.select([db.func.count()]).select_from(t.__table__)) for t in (Venue, Artist)
+        ):
+            raise SystemExit("The database holds venues or artists already, pass --reset to empty it first.")
+
+        # restarting the ids makes them the same from run to run, the shows refer to them
+        with connection.begin():
+            connection.execute(f"""TRUNCATE {", ".join(f'"{t.__tablename__}"' for t in tables)} RESTART IDENTITY CASCADE""")
+
+        run_import(VenueImporter, connection, profile_rows(
+            rng_for(args.seed, 'venues'), VENUE_KINDS, args.venues, venue=True
+        ), args.chunk_size, "venues")
+        run_import(ArtistImporter, connection, profile_rows(
+            rng_for(args.seed, 'artists'), ARTIST_KINDS, args.artists
+        ), args.chunk_size, "artists")
+        shows = run_import(ShowImporter, connection, show_rows(
+            rng_for(args.seed, 'shows'), args.venues, args.artists, args.shows, anchor, args.past_days, args.future_days
+        ), args.chunk_size, "shows")
+
+        if shows < args.shows:
+            print(f"Only {shows} shows fit, a venue or an artist plays once a day at most.", file=sys.stderr)
+
+        for summary in (VenueShowsSummary, ArtistShowsSummary):
+            if not summary.rebuild():
+                raise SystemExit(f"{summary.__tablename__} could not be rebuilt, run `flask summary rebuild`.")
+
+        with connection.begin():
+            connection.execute("ANALYZE")
+
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Prints the query plans of the Show access paths before and after the
+`c81f4e2b6d90` indexes and the `1b4e8f2a7c93` exclusion constraints, whose
+gist indexes serve the conflict checks of bookings.
+
+The "before" plans are taken inside a transaction that drops the indexes
+and constraints and is rolled back afterwards, the drop holds an exclusive
+lock on "Show" for the length of the run, so only point this at a local database:
+
+    python benchmarks/show_plans.py [--venue-id 1] [--artist-id 1] [--start-time 2030-01-01T20:00] [--batch-size 50]
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, db  # noqa: E402
+from models import BATCH_CONFLICTS  # noqa: E402
+
+
+INDEXES = (
+    'ix_Show_venue_id_start_time',
+    'ix_Show_artist_id_start_time',
+)
+
+CONSTRAINTS = (
+    'ex_Show_venue_id_during',
+    'ex_Show_artist_id_during',
+)
+
+QUERIES = {
+    "venue profile shows": """
+        SELECT * FROM "Show" WHERE venue_id = :venue_id ORDER BY start_time, id
+    """,
+    "artist profile shows": """
+        SELECT * FROM "Show" WHERE artist_id = :artist_id ORDER BY start_time, id
+    """,
+    "venue upcoming/past counts": """
+        SELECT count(CASE WHEN start_time >= now() THEN id END),
+               count(CASE WHEN start_time < now() THEN id END)
+        FROM "Show" WHERE venue_id = :venue_id
+    """,
+    # `Show.get_conflict`
+    "show conflict check": """
+        SELECT * FROM "Show"
+        WHERE (venue_id = :venue_id OR artist_id = :artist_id)
+        AND tsrange(start_time, end_time) && tsrange(:start_time, :end_time)
+        ORDER BY start_time, id LIMIT 1
+    """,
+    # `Show.batch_conflicts`
+    "tour conflicts check": BATCH_CONFLICTS.text,
+}
+
+
+def explain(connection, params):
+    plans = {}
+
+    for name, sql in QUERIES.items():
+        rows = connection.execute(
+            db.text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"),
+            params
+        )
+        plans[name] = "\n".join(row[0] for row in rows)
+
+    return plans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--venue-id", type=int, default=1)
+    parser.add_argument("--artist-id", type=int, default=1)
+    parser.add_argument("--start-time", type=datetime.fromisoformat, default=datetime(2030, 1, 1, 20))
+    parser.add_argument("--batch-size", type=int, default=50, help="Entries of the checked tour.")
+    args = parser.parse_args()
+
+    end_time = args.start_time + timedelta(hours=2)
+
+    # a tour of the artists following --artist-id, each at the venue following the previous one's
+    positions = list(range(args.batch_size))
+
+    params = {
+        "venue_id": args.venue_id,
+        "artist_id": args.artist_id,
+        "start_time": args.start_time,
+        "end_time": end_time,
+        "positions": positions,
+        "venue_ids": [args.venue_id + p for p in positions],
+        "artist_ids": [args.artist_id + p for p in positions],
+        "start_times": [args.start_time] * len(positions),
+        "end_times": [end_time] * len(positions)
+    }
+
+    with app.app_context():
+        connection = db.engine.connect()
+        transaction = connection.begin()
+
+        try:
+            after = explain(connection, params)
+
+            for index in INDEXES:
+                connection.execute(db.text(f'DROP INDEX IF EXISTS "{index}"'))
+
+            for constraint in CONSTRAINTS:
+                connection.execute(db.text(f'ALTER TABLE "Show" DROP CONSTRAINT IF EXISTS "{constraint}"'))
+
+            before = explain(connection, params)
+
+        finally:
+            transaction.rollback()
+            connection.close()
+
+    for name in QUERIES:
+        print(f"=== {name} ===")
+        print("--- before ---")
+        print(before[name])
+        print("--- after ---")
+        print(after[name])
+        print()
+
+
+if __name__ == '__main__':
+    main()
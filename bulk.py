@@ -0,0 +1,599 @@
+import csv
+import io
+import json
+import time
+from abc import ABC, abstractmethod
+from contextlib import closing
+from datetime import datetime, timedelta
+from itertools import islice
+from sqlalchemy import exc
+from models import *
+
+
+def read_rows(file, format=None):
+    """
+    (1) Streams the rows of a CSV file (with a header line) or a JSON lines file
+    (2) A line that can't be parsed doesn't stop the others, it comes out as
+        the ValueError describing it, see `checked_row`
+    :param file: (file) opened in text mode
+    :param format: 'csv' or 'jsonl', guessed from the file name when not given
+    :return: generator of (line number, dict or ValueError) pairs
+    """
+    format = format or ('jsonl' if getattr(file, 'name', '').endswith(('.jsonl', '.ndjson')) else 'csv')
+
+    if format == 'csv':
+        reader = csv.DictReader(file)
+        line_num = 0
+
+        while True:
+            try:
+                row = next(reader)
+
+            except StopIteration:
+                return
+
+            # the reader doesn't count the line it failed on
+            except csv.Error as error:
+                line_num = max(reader.line_num, line_num) + 1
+                yield line_num, ValueError(f"malformed CSV: {error}")
+                continue
+
+            line_num = reader.line_num
+            yield line_num, row
+
+    else:
+        for line_num, line in enumerate(file, 1):
+            if line.strip():
+                try:
+                    yield line_num, json.loads(line)
+
+                except ValueError as error:
+                    yield line_num, ValueError(f"malformed JSON: {error}")
+
+
+def checked_row(row):
+    # rows from `read_rows`, lines that could not be parsed or are not objects are rejected
+    if isinstance(row, ValueError):
+        raise row
+
+    if not isinstance(row, dict):
+        raise ValueError(f"a row has to be an object, not {type(row).__name__}")
+
+    return row
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+
+    while True:
+        chunk = list(islice(iterator, size))
+
+        if not chunk:
+            return
+
+        yield chunk
+
+
+def parse_enum(enum, value):
+    # accept the member name (stored in the database) or its display value (used by the forms)
+    value = str(value).strip()
+
+    if value in enum.__members__:
+        return enum[value]
+
+    try:
+        return enum(value)
+
+    except ValueError:
+        raise ValueError(f"'{value}' is not a valid {enum.__name__}") from None
+
+
+def parse_list(value):
+    if isinstance(value, list):
+        return value
+
+    return [v for v in (value or '').split(',') if v.strip()]
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+
+    return str(value or '').strip().lower() in ('1', 'true', 't', 'yes', 'y')
+
+
+def parse_datetime(value, field):
+    if not isinstance(value, datetime):
+        value = datetime.fromisoformat(str(value).strip())
+
+    # show times are stored as naive local times, Postgres would drop the offset
+    if value.tzinfo is not None:
+        raise ValueError(f"'{field}' has to be a local time, without a UTC offset")
+
+    return value
+
+
+def parse_show_times(row):
+    start_time = parse_datetime(required(row, 'start_time'), 'start_time')
+
+    # the end is given, or follows from a duration in minutes, or the default duration
+    if row.get('end_time') not in (None, ''):
+        end_time = parse_datetime(row.get('end_time'), 'end_time')
+
+    else:
+        end_time = start_time + (
+            timedelta(minutes=int(row.get('duration'))) if row.get('duration') not in (None, '')
+            else Show.default_duration
+        )
+
+    if end_time <= start_time:
+        raise ValueError("'end_time' has to be after 'start_time'")
+
+    return {"start_time": start_time, "end_time": end_time}
+
+
+def optional(value):
+    return str(value).strip() or None if value is not None else None
+
+
+def required(row, field):
+    value = row.get(field)
+
+    if value is None or str(value).strip() == '':
+        raise ValueError(f"'{field}' is required")
+
+    return value
+
+
+def copy_value(value):
+    if value is None:
+        return None
+
+    if isinstance(value, Enum):
+        return value.name
+
+    if isinstance(value, list):
+        return '{' + ','.join(copy_value(v) for v in value) + '}'
+
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+
+    return value
+
+
+class ImportReport:
+
+    def __init__(self):
+        self.read = 0
+        self.imported = 0
+        self.errors = []
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self):
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+    def reject(self, line_num, error):
+        self.errors.append((line_num, str(error)))
+
+
+class Importer(ABC):
+    model = None
+
+    columns = ()
+
+    def __init__(self, connection, chunk_size=5000, method='copy'):
+        self.connection = connection
+        self.chunk_size = chunk_size
+        self.method = method
+
+    @abstractmethod
+    def validate(self, row):
+        """
+        (1) Checks and converts one row read from the file
+        :return: (dict) the values to write, raises ValueError, TypeError
+                 or KeyError to reject the row
+        """
+
+    def resolve(self, rows, report):
+        return rows
+
+    def write(self, rows):
+        """
+        (1) Inserts a chunk of validated rows with one COPY, or with one
+            executemany of the INSERT statement
+        :param rows: (list) of dicts holding the `columns` values
+        """
+        if self.method == 'copy':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+
+            for row in rows:
+                writer.writerow([copy_value(row[c]) for c in self.columns])
+
+            buffer.seek(0)
+
+            with closing(self.connection.connection.cursor()) as cursor:
+                cursor.copy_expert(
+                    f"""COPY "{self.model.__tablename__}" ({', '.join(self.columns)}) FROM STDIN WITH (FORMAT csv)""",
+                    buffer
+                )
+
+        else:
+            self.connection.execute(self.model.__table__.insert(), rows)
+
+    def run(self, rows, progress=None):
+        """
+        (1) Validates the rows, rejecting the invalid ones with their line number
+        (2) Writes the valid ones chunk by chunk, each chunk in its own transaction
+        :param rows: iterable of (line number, dict) pairs, see `read_rows`
+        :param progress: (callable) called with the report after every chunk
+        :return: ImportReport
+        """
+        report = ImportReport()
+
+        for chunk in chunked(rows, self.chunk_size):
+            valid = []
+            report.read += len(chunk)
+
+            for line_num, row in chunk:
+                try:
+                    valid.append((line_num, self.validate(checked_row(row))))
+
+                except (ValueError, TypeError, KeyError) as error:
+                    report.reject(line_num, error)
+
+            valid = self.resolve(valid, report)
+
+            if valid:
+                try:
+                    with self.connection.begin():
+                        self.write([row for line_num, row in valid])
+
+                # COPY raises the driver's own errors, executemany SQLAlchemy's
+                except (
+                    exc.IntegrityError, exc.DataError,
+                    self.connection.dialect.dbapi.IntegrityError, self.connection.dialect.dbapi.DataError
+                ) as error:
+                    # e.g. overlapping shows or values the columns can't hold,
+                    # the chunk is rolled back as a whole
+                    for line_num, row in valid:
+                        report.reject(line_num, f"chunk rejected: {str(getattr(error, 'orig', error)).splitlines()[0]}")
+
+                else:
+                    report.imported += len(valid)
+
+            if progress:
+                progress(report)
+
+        return report
+
+
+class ProfileImporter(Importer):
+
+    def validate(self, row):
+        values = {**self.profile_values(row), **self.extra_values(row)}
+
+        # rejected here with the other bad rows, rather than failing their whole chunk
+        for field, value in values.items():
+            length = getattr(self.model.__table__.c[field].type, 'length', None)
+
+            if isinstance(value, str) and length and len(value) > length:
+                raise ValueError(f"'{field}' is longer than {length} characters")
+
+        return values
+
+    def extra_values(self, row):
+        return {}
+
+    def profile_values(self, row):
+        return {
+            "name": str(required(row, 'name')).strip(),
+            "city": str(required(row, 'city')).strip(),
+            "state": parse_enum(State, required(row, 'state')),
+            "phone": optional(row.get('phone')),
+            "genres": [parse_enum(Genres, g) for g in parse_list(required(row, 'genres'))],
+            "website": optional(row.get('website')),
+            "image_link": optional(row.get('image_link')),
+            "facebook_link": optional(row.get('facebook_link')),
+            "seeking_description": optional(row.get('seeking_description')),
+        }
+
+
+class VenueImporter(ProfileImporter):
+    model = Venue
+
+    columns = (
+        'name', 'city', 'state', 'address', 'phone', 'genres', 'website',
+        'image_link', 'facebook_link', 'seeking_talent', 'seeking_description'
+    )
+
+    def extra_values(self, row):
+        return {
+            "address": str(required(row, 'address')).strip(),
+            "seeking_talent": parse_bool(row.get('seeking_talent'))
+        }
+
+
+class ArtistImporter(ProfileImporter):
+    model = Artist
+
+    columns = (
+        'name', 'city', 'state', 'phone', 'genres', 'website',
+        'image_link', 'facebook_link', 'seeking_venue', 'seeking_description'
+    )
+
+    def extra_values(self, row):
+        return {
+            "seeking_venue": parse_bool(row.get('seeking_venue'))
+        }
+
+
+class ShowImporter(Importer):
+    model = Show
+
+    columns = ('venue_id', 'artist_id', 'start_time', 'end_time')
+
+    # rows refer to profiles by id ('venue_id', 'artist_id') or by unique name ('venue', 'artist')
+    references = {
+        'venue_id': ('venue', Venue),
+        'artist_id': ('artist', Artist)
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ids = {column: set() for column in self.references}
+        self.names = {column: {} for column in self.references}
+
+    def validate(self, row):
+        show = parse_show_times(row)
+
+        for column, (field, model) in self.references.items():
+            if row.get(column) not in (None, ''):
+                show[column] = int(row.get(column))
+
+            else:
+                show[field] = str(required(row, field)).strip()
+
+        return show
+
+    def lookup(self, model, column, values):
+        """
+        (1) Resolves the ids or names not seen in earlier chunks with one IN query,
+            names shared by several profiles are left out as ambiguous
+        """
+        ids = self.ids[column]
+        names = self.names[column]
+
+        missing_ids = {v for v in values if isinstance(v, int)} - ids
+        missing_names = {v for v in values if isinstance(v, str)} - names.keys()
+
+        if missing_ids:
+            ids.update(
+                row[0] for row in self.connection.execute(
+                    db.select([model.id]).where(model.id.in_(missing_ids))
+                )
+            )
+
+        if missing_names:
+            found = self.connection.execute(
+                db.select([model.name, db.func.array_agg(model.id)]).where(
+                    model.name.in_(missing_names)
+                ).group_by(model.name)
+            )
+            names.update({name: (found_ids[0] if len(found_ids) == 1 else None) for name, found_ids in found})
+            names.update({name: None for name in missing_names - names.keys()})
+
+    def resolve(self, rows, report):
+        for column, (field, model) in self.references.items():
+            self.lookup(model, column, [row.get(column, row.get(field)) for line_num, row in rows])
+
+        resolved = []
+
+        for line_num, row in rows:
+            try:
+                for column, (field, model) in self.references.items():
+                    if column in row:
+                        if row[column] not in self.ids[column]:
+                            raise ValueError(f"{model.__name__} {row[column]} does not exist")
+
+                    else:
+                        name = row.pop(field)
+                        row[column] = self.names[column].get(name)
+
+                        if row[column] is None:
+                            raise ValueError(f"{model.__name__} '{name}' does not exist or is not unique")
+
+                resolved.append((line_num, row))
+
+            except ValueError as error:
+                report.reject(line_num, error)
+
+        return resolved
+
+
+IMPORTERS = {
+    'venues': VenueImporter,
+    'artists': ArtistImporter,
+    'shows': ShowImporter
+}
+
+
+def book_tour(rows, atomic=False):
+    """
+    (1) Validates a tour's entries, then books the valid ones through `Show.book`
+    :param rows: (list) of dicts holding 'artist_id', 'venue_id', 'start_time'
+                 and optionally 'end_time' or 'duration' in minutes
+    :param atomic: (bool) book nothing unless every entry can be booked
+    :return: (list) of result dicts, one per row in the same order, each holding
+             'row', 'status' ('created', 'invalid', 'not_found', 'conflict',
+             'skipped' or 'failed') and 'show_id' or 'error'
+    """
+    entries = {}
+    results = {}
+
+    for position, row in enumerate(rows):
+        try:
+            row = checked_row(row)
+            entries[position] = {
+                "venue_id": int(required(row, 'venue_id')),
+                "artist_id": int(required(row, 'artist_id')),
+                **parse_show_times(row)
+            }
+
+        except (ValueError, TypeError, AttributeError) as error:
+            results[position] = {"status": "invalid", "error": str(error)}
+
+    if results and atomic:
+        results.update({p: {"status": "skipped", "error": "other entries of the batch failed"} for p in entries})
+
+    elif entries:
+        results.update(Show.book(entries, atomic=atomic))
+
+    return [{"row": position, **results[position]} for position in sorted(results)]
+
+
+class Exporter:
+    model = None
+
+    columns = ()
+
+    # rows fetched from the server-side cursor at a time
+    batch_size = 1000
+
+    def __init__(self, fields=None):
+        if fields:
+            unknown = [f for f in fields if f not in self.columns]
+
+            if unknown:
+                raise ValueError(f"unknown {', '.join(unknown)} field(s), choose from {', '.join(self.columns)}")
+
+        self.fields = list(fields or self.columns)
+
+    def projection(self):
+        return [getattr(self.model, field) for field in self.fields]
+
+    def query(self):
+        return db.select(self.projection()).order_by(self.model.id)
+
+    def rows(self, connection):
+        """
+        (1) Streams the projected rows from a server-side cursor,
+            only `batch_size` rows are held in memory at a time
+        :param connection: (Connection) kept open until the generator is exhausted
+        :return: generator of row tuples
+        """
+        result = connection.execution_options(stream_results=True).execute(self.query())
+
+        try:
+            while True:
+                batch = result.fetchmany(self.batch_size)
+
+                if not batch:
+                    return
+
+                yield from batch
+
+        finally:
+            result.close()
+
+    def csv(self, connection):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(self.fields)
+
+        for i, row in enumerate(self.rows(connection), 1):
+            writer.writerow([export_value(v, ',') for v in row])
+
+            # hand out the text a batch at a time rather than a line at a time
+            if i % self.batch_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        yield buffer.getvalue()
+
+    def ndjson(self, connection):
+        lines = []
+
+        for row in self.rows(connection):
+            lines.append(json.dumps(dict(zip(self.fields, (export_value(v) for v in row)))))
+
+            if len(lines) == self.batch_size:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+
+def export_value(value, separator=None):
+    # enum names and ISO times read back through the importers
+    if isinstance(value, Enum):
+        return value.name
+
+    if isinstance(value, list):
+        values = [export_value(v) for v in value]
+        return separator.join(values) if separator else values
+
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    return value
+
+
+class VenueExporter(Exporter):
+    model = Venue
+
+    columns = ('id',) + VenueImporter.columns
+
+
+class ArtistExporter(Exporter):
+    model = Artist
+
+    columns = ('id',) + ArtistImporter.columns
+
+
+class ShowExporter(Exporter):
+    model = Show
+
+    columns = ('id', 'start_time', 'end_time', 'venue_id', 'venue', 'artist_id', 'artist')
+
+    names = {
+        'venue': Venue.name.label('venue'),
+        'artist': Artist.name.label('artist')
+    }
+
+    def projection(self):
+        return [self.names[field] if field in self.names else getattr(Show, field) for field in self.fields]
+
+    def query(self):
+        query = super().query()
+
+        # join only the profiles whose names were asked for
+        if 'venue' in self.fields:
+            query = query.where(Show.venue_id == Venue.id)
+
+        if 'artist' in self.fields:
+            query = query.where(Show.artist_id == Artist.id)
+
+        return query
+
+
+EXPORTERS = {
+    'venues': VenueExporter,
+    'artists': ArtistExporter,
+    'shows': ShowExporter
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
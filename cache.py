@@ -0,0 +1,374 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+from collections import OrderedDict
+from threading import Event, Lock, RLock
+from time import monotonic
+from uuid import uuid4
+
+
+MISSING = object()
+
+
+class LRUCache:
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, MISSING)
+
+            if entry is not MISSING and entry[1] is not None and entry[1] <= monotonic():
+                del self._entries[key]
+                entry = MISSING
+
+            if entry is MISSING:
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+
+        with self._lock:
+            self._entries[key] = (value, monotonic() + ttl if ttl else None)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+class SearchCache:
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.entries = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.generations = {}
+        self.invalidated_at = 0
+        self._lock = RLock()
+
+    def configure(self, maxsize=None, ttl=None):
+        if maxsize is not None:
+            self.entries.maxsize = maxsize
+
+        if ttl is not None:
+            self.entries.ttl = ttl
+
+    def key(self, model, term, limit):
+        # bumping a model's generation orphans all of its entries, the LRU evicts them later
+        return model.__name__, self.generations.get(model.__name__, 0), term.lower(), limit
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries.set(key, value)
+
+    def invalidate(self, *models):
+        with self._lock:
+            for model in models:
+                self.generations[model.__name__] = self.generations.get(model.__name__, 0) + 1
+
+            self.invalidated_at = time.time()
+
+    def stats(self):
+        return self.entries.stats()
+
+
+class Flight:
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+
+
+class SingleFlight:
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.calls = 0
+        self.shared = 0
+        self._flights = {}
+        self._lock = Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+
+            if leader:
+                flight = self._flights[key] = Flight()
+                self.calls += 1
+
+            else:
+                self.shared += 1
+
+        # followers wait for the leader's result, or run it themselves if it takes too long
+        if not leader:
+            if flight.done.wait(self.timeout):
+                return flight.result
+
+            return func()
+
+        try:
+            flight.result = func()
+
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+            flight.done.set()
+
+        return flight.result
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "calls": self.calls,
+                "shared": self.shared
+            }
+
+
+class MemoryBackend:
+
+    def __init__(self, maxsize=512):
+        self.entries = LRUCache(maxsize=maxsize)
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.entries.set(key, value, ttl=ttl)
+
+    def delete(self, key):
+        self.entries.delete(key)
+
+    def stats(self):
+        return self.entries.stats()
+
+
+class FileBackend:
+
+    def __init__(self, directory, maxsize=512, sweep_every=64):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.sweep_every = sweep_every
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+        self._lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        # the kind of entry ('page', 'tag') leads the file name, only pages are evicted
+        kind = key.partition(':')[0]
+        return os.path.join(self.directory, f"{kind}-{hashlib.sha1(key.encode()).hexdigest()}")
+
+    @staticmethod
+    def remove(path):
+        # another worker may have removed it first
+        try:
+            os.remove(path)
+
+        except OSError:
+            pass
+
+    def get(self, key):
+        path = self.path(key)
+
+        try:
+            with open(path, 'rb') as file:
+                expires, value = pickle.load(file)
+
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.remove(path)
+            self.misses += 1
+            return None
+
+        if expires is not None and expires <= time.time():
+            self.remove(path)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        # write aside and rename, so other workers never read a half written entry
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory)
+
+        with os.fdopen(descriptor, 'wb') as file:
+            pickle.dump((time.time() + ttl if ttl else None, value), file)
+
+        os.replace(temporary, self.path(key))
+
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % self.sweep_every == 0
+
+        if sweep:
+            self.sweep()
+
+    def delete(self, key):
+        self.remove(self.path(key))
+
+    def sweep(self):
+        """
+        (1) Evicts the pages written longest ago once there are more than maxsize,
+            run every sweep_every writes, so the directory holds at most about
+            maxsize + sweep_every pages per worker whatever URLs clients ask for
+        """
+        pages = []
+
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith('page-'):
+                try:
+                    pages.append((entry.stat().st_mtime, entry.path))
+
+                except OSError:
+                    pass
+
+        if len(pages) <= self.maxsize:
+            return
+
+        pages.sort()
+
+        for mtime, path in pages[:len(pages) - self.maxsize]:
+            self.remove(path)
+
+        with self._lock:
+            self.evictions += len(pages) - self.maxsize
+
+    def stats(self):
+        return {
+            "directory": self.directory,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+
+class PageCache:
+    # bumped with every invalidation, whatever the tags
+    generation_tag = '*'
+
+    def __init__(self, backend=None, ttl=300):
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+
+    def configure(self, backend=None, ttl=None):
+        if backend is not None:
+            self.backend = backend
+
+        if ttl is not None:
+            self.ttl = ttl
+
+    def versions(self, tags):
+        versions = {}
+
+        for tag in tags:
+            version = self.backend.get(f"tag:{tag}")
+
+            # a tag without a version (never bumped, or evicted) gets a fresh one,
+            # so entries stored against an older version can never match again
+            if version is None:
+                version = uuid4().hex
+                self.backend.set(f"tag:{tag}", version)
+
+            versions[tag] = version
+
+        return versions
+
+    def get(self, key):
+        entry = self.backend.get(f"page:{key}")
+
+        if entry is None:
+            return None
+
+        body, versions = entry
+
+        # one of its tags was bumped since, the entry can never match again
+        if self.versions(versions) != versions:
+            self.backend.delete(f"page:{key}")
+            return None
+
+        return body
+
+    def generation(self):
+        # read before a page renders, see `set`
+        return self.versions([self.generation_tag])[self.generation_tag]
+
+    def set(self, key, body, tags, ttl=None, generation=None):
+        """
+        (1) Stores the page against the current versions of its tags
+        (2) Unless something was invalidated since `generation` was read, then
+            the page may have been rendered from rows older than these versions
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+
+        if ttl <= 0:
+            return
+
+        # the versions are read before the generation is checked, and `invalidate`
+        # bumps the generation before the tags, so a bump the check misses comes after
+        # these versions too and drops the entry
+        versions = self.versions(tags)
+
+        if generation is not None and self.generation() != generation:
+            return
+
+        self.backend.set(f"page:{key}", (body, versions), ttl=ttl)
+
+    def invalidate(self, *tags):
+        for tag in (self.generation_tag, *tags):
+            self.backend.set(f"tag:{tag}", uuid4().hex)
+
+        self.backend.set("invalidated:at", time.time())
+
+    def invalidated_at(self):
+        at = self.backend.get("invalidated:at")
+
+        # evicted, like a tag without a version it counts as just invalidated
+        if at is None:
+            at = time.time()
+            self.backend.set("invalidated:at", at)
+
+        return at
+
+    def stats(self):
+        return self.backend.stats()
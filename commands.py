@@ -0,0 +1,227 @@
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from models import *
+from bulk import IMPORTERS, EXPORTERS, EXPORT_FORMATS, book_tour, read_rows
+
+
+# ----------------------------------------------------------------------------#
+# Shows Summary Commands.
+# ----------------------------------------------------------------------------#
+
+
+summary_cli = AppGroup('summary', help='Maintain the venue and artist shows summaries.')
+
+SUMMARIES = (VenueShowsSummary, ArtistShowsSummary)
+
+
+@summary_cli.command('rebuild')
+def rebuild_summary():
+    """
+    (1) Recomputes every venue and artist shows summary from the Show table
+    """
+
+    for summary in SUMMARIES:
+        if summary.rebuild():
+            click.echo(f"{summary.__tablename__} rebuilt.")
+
+        else:
+            raise click.ClickException(f"{summary.__tablename__} could not be rebuilt.")
+
+
+@summary_cli.command('roll')
+@click.option('--every', type=float, default=None,
+              help='Keep rolling every given number of seconds instead of once.')
+def roll_summary(every):
+    """
+    (1) Moves shows that have started since the last run from upcoming to past,
+        meant to run from cron or as a long-running job with --every
+    """
+
+    while True:
+        for summary in SUMMARIES:
+            if not summary.roll():
+                click.echo(f"{summary.__tablename__} could not be rolled.", err=True)
+
+        if every is None:
+            break
+
+        time.sleep(every)
+
+
+# ----------------------------------------------------------------------------#
+# Import Commands.
+# ----------------------------------------------------------------------------#
+
+
+import_cli = AppGroup('import', help='Bulk import venues, artists and shows from CSV or JSON lines files.')
+
+
+def import_command(kind):
+
+    @import_cli.command(kind, help=f"Imports {kind} from FILE, a CSV file with a header line or a JSON lines file.")
+    @click.argument('file', type=click.File('r', encoding='utf-8'))
+    @click.option('--format', type=click.Choice(['csv', 'jsonl']), default=None,
+                  help='File format, guessed from the file name by default.')
+    @click.option('--chunk-size', type=int, default=5000, show_default=True,
+                  help='Rows written per COPY/executemany and per transaction.')
+    @click.option('--method', type=click.Choice(['copy', 'executemany']), default='copy', show_default=True)
+    @click.option('--max-errors', type=int, default=20, show_default=True,
+                  help='Rejected rows to print, all of them are counted.')
+    def command(file, format, chunk_size, method, max_errors):
+        importer = IMPORTERS[kind](db.engine.connect(), chunk_size=chunk_size, method=method)
+
+        def progress(report):
+            click.echo(
+                f"{report.read} read, {report.imported} imported, {len(report.errors)} rejected "
+                f"({report.rate:.0f} rows/s)",
+                err=True
+            )
+
+        try:
+            report = importer.run(read_rows(file, format), progress=progress)
+
+        finally:
+            importer.connection.close()
+
+        for line_num, error in sorted(report.errors)[:max_errors]:
+            click.echo(f"line {line_num}: {error}", err=True)
+
+        # COPY and executemany bypass the ORM events that keep the summaries current
+        if kind == 'shows' and report.imported:
+            for summary in SUMMARIES:
+                if not summary.rebuild():
+                    click.echo(f"{summary.__tablename__} could not be rebuilt, run `flask summary rebuild`.", err=True)
+
+        DBActions.exception_handler.committed(importer.model, 'import')
+
+        click.echo(
+            f"Imported {report.imported} of {report.read} {kind} in {report.elapsed:.1f}s "
+            f"({report.rate:.0f} rows/s), {len(report.errors)} rejected."
+        )
+
+    return command
+
+
+for kind in IMPORTERS:
+    import_command(kind)
+
+
+# ----------------------------------------------------------------------------#
+# Export Commands.
+# ----------------------------------------------------------------------------#
+
+
+export_cli = AppGroup('export', help='Stream venues, artists or shows to CSV or NDJSON.')
+
+
+def export_command(kind):
+
+    @export_cli.command(kind, help=f"Exports every one of the {kind} to OUTPUT, standard output by default.")
+    @click.argument('output', type=click.File('w', encoding='utf-8', lazy=True), default='-')
+    @click.option('--format', type=click.Choice(list(EXPORT_FORMATS)), default='csv', show_default=True)
+    @click.option('--fields', default=None, help='Comma separated columns to export, all of them by default.')
+    def command(output, format, fields):
+        try:
+            exporter = EXPORTERS[kind](fields=fields.split(',') if fields else None)
+
+        except ValueError as error:
+            raise click.BadParameter(str(error), param_hint='--fields')
+
+        with db.engine.connect() as connection:
+            for text in getattr(exporter, format)(connection):
+                output.write(text)
+
+    return command
+
+
+for kind in EXPORTERS:
+    export_command(kind)
+
+
+# ----------------------------------------------------------------------------#
+# Purge Commands.
+# ----------------------------------------------------------------------------#
+
+
+PROFILES = {
+    'venue': Venue,
+    'artist': Artist
+}
+
+
+@click.command('purge')
+@click.argument('kind', type=click.Choice(list(PROFILES)))
+@click.argument('id', type=int)
+@click.option('--batch-size', type=int, default=5000, show_default=True,
+              help='Shows deleted per transaction.')
+@with_appcontext
+def purge_command(kind, id, batch_size):
+    """
+    (1) Deletes a venue or an artist with all of its shows, a batch of shows
+        per transaction, for profiles too large to delete in one go
+    """
+
+    if PROFILES[kind].get_one(id=id) is None:
+        raise click.ClickException(f"{kind.capitalize()} {id} does not exist.")
+
+    deleted = PROFILES[kind].purge(id, batch_size=batch_size)
+    click.echo(f"{kind.capitalize()} {id} deleted with {deleted} shows.")
+
+
+@click.command('purge-pending')
+@click.option('--every', type=float, default=None,
+              help='Keep purging every given number of seconds instead of once.')
+@click.option('--batch-size', type=int, default=None,
+              help='Shows deleted per transaction, PURGE_BATCH_SIZE by default.')
+@with_appcontext
+def purge_pending_command(every, batch_size):
+    """
+    (1) Purges the venues and artists scheduled for deletion from the web,
+        meant to run from cron or as a long-running job with --every
+    """
+    batch_size = batch_size or current_app.config.get('PURGE_BATCH_SIZE', 5000)
+
+    while True:
+        for kind, profile in PROFILES.items():
+            for id, deleted in profile.purge_pending(batch_size=batch_size).items():
+                click.echo(f"{kind.capitalize()} {id} deleted with {deleted} shows.")
+
+        if every is None:
+            break
+
+        time.sleep(every)
+
+
+# ----------------------------------------------------------------------------#
+# Tour Commands.
+# ----------------------------------------------------------------------------#
+
+
+@click.command('book-tour')
+@click.argument('file', type=click.File('r', encoding='utf-8'))
+@click.option('--format', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='File format, guessed from the file name by default.')
+@click.option('--atomic', is_flag=True, help='Book nothing unless every show can be booked.')
+@with_appcontext
+def book_tour_command(file, format, atomic):
+    """
+    (1) Books the shows listed in FILE (artist_id, venue_id, start_time and
+        duration or end_time) at once, and prints a result per show
+    """
+
+    rows = [row for line_num, row in read_rows(file, format)]
+    results = book_tour(rows, atomic=atomic)
+
+    for result in results:
+        click.echo(
+            f"{result.get('row') + 1:>4} {result.get('status'):<10} "
+            f"{result.get('show_id') or result.get('error')}"
+        )
+
+    created = sum(r.get('status') == 'created' for r in results)
+    click.echo(f"Booked {created} of {len(results)} shows.")
+
+    if created < len(results):
+        raise SystemExit(1)
@@ -1,5 +1,7 @@
 import os
-SECRET_KEY = os.urandom(32)
+# Signs the session cookie, which also carries the read replicas' sticky window, so
+# every worker has to share it once replicas are configured, see below
+SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -10,5 +12,61 @@ DEBUG = True
 
 
 # This is a postgresql database public uri for testing app immediately
-SQLALCHEMY_DATABASE_URI = 'postgres://fyyur@dbhost.fyyur.ml:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgres://fyyur@dbhost.fyyur.ml:5432/fyyur')
 SQLALCHEMY_TRACK_MODIFICATIONS = True
+
+# Connection pool, per worker process, see "Connection Pooling" in the README.
+# 'queue' keeps DB_POOL_SIZE connections open (plus up to DB_MAX_OVERFLOW on bursts),
+# 'pgbouncer' opens one per checkout and leaves pooling to PgBouncer in transaction mode
+DB_POOL_MODE = os.environ.get('DB_POOL_MODE', 'queue')
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1').lower() not in ('0', 'false', 'no')
+
+# Read replicas, comma separated, reads are spread over them round-robin.
+# A replica more than MAX_LAG seconds behind is skipped, and a client reads from the
+# primary for STICKY_FOR seconds after its own writes
+SQLALCHEMY_REPLICA_URIS = [uri for uri in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri]
+SQLALCHEMY_REPLICA_MAX_LAG = float(os.environ.get('DB_REPLICA_MAX_LAG', 5))
+SQLALCHEMY_REPLICA_CHECK_INTERVAL = 2
+SQLALCHEMY_REPLICA_STICKY_FOR = 5
+
+if SQLALCHEMY_REPLICA_URIS and not os.environ.get('SECRET_KEY'):
+    raise RuntimeError("Set SECRET_KEY, the same for every worker, when DATABASE_REPLICA_URLS is set")
+
+# In-process search results cache, entries are also dropped on any related change
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = 60
+
+# Rendered pages cache, use the 'file' backend to share it between worker processes.
+# Either backend keeps about PAGE_CACHE_SIZE pages and evicts the oldest ones first
+PAGE_CACHE_BACKEND = os.environ.get('PAGE_CACHE_BACKEND', 'memory')
+PAGE_CACHE_DIR = os.environ.get('PAGE_CACHE_DIR', os.path.join(basedir, '.page_cache'))
+PAGE_CACHE_SIZE = 512
+PAGE_CACHE_TTL = 300
+
+# Bump to invalidate every ETag handed out, e.g. when templates change
+ETAG_VERSION = os.environ.get('ETAG_VERSION', '1')
+
+# Profiles with more shows than this are scheduled for `flask purge-pending`, which deletes
+# them in batches of PURGE_BATCH_SIZE shows, instead of inside the request. 0 keeps every
+# delete in the request
+PURGE_ASYNC_THRESHOLD = int(os.environ.get('PURGE_ASYNC_THRESHOLD', 0))
+PURGE_BATCH_SIZE = int(os.environ.get('PURGE_BATCH_SIZE', 5000))
+
+# Most shows booked by one /shows/batch request
+TOUR_MAX_SHOWS = 500
+
+# Per request SQL instrumentation, X-Query-Count and Server-Timing headers and a
+# logged report for a sample of the requests, and for any request running the same
+# statement SQL_REPEATED_THRESHOLD times or more (an N+1 query)
+SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', '1').lower() not in ('0', 'false', 'no')
+SQL_LOG_SAMPLE_RATE = float(os.environ.get('SQL_LOG_SAMPLE_RATE', 0.01))
+SQL_SLOWEST_STATEMENTS = 5
+SQL_REPEATED_THRESHOLD = 5
+
+# Prometheus metrics at /metrics, workers of one server add theirs up when
+# the PROMETHEUS_MULTIPROC_DIR environment variable names a directory they share
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1').lower() not in ('0', 'false', 'no')
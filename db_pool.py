@@ -0,0 +1,159 @@
+from threading import Lock
+from time import monotonic
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool, NullPool
+
+
+class PoolMetrics:
+
+    def __init__(self):
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.overflows = 0
+        self.timeouts = 0
+        self.invalidations = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._lock = Lock()
+
+    @property
+    def in_use(self):
+        return self.checkouts - self.checkins
+
+    def checked_out(self, waited, overflowed=False):
+        with self._lock:
+            self.checkouts += 1
+            self.overflows += overflowed
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_use": self.in_use,
+                "checkouts": self.checkouts,
+                "connects": self.connects,
+                "overflows": self.overflows,
+                "timeouts": self.timeouts,
+                "invalidations": self.invalidations,
+                "wait_total": round(self.wait_total, 6),
+                "wait_max": round(self.wait_max, 6),
+                "wait_avg": round(self.wait_total / self.checkouts, 6) if self.checkouts else 0.0
+            }
+
+
+class InstrumentedPool:
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+        # a recreated pool is handed this pool's listeners, see `recreate`
+        if not kwargs.get('_dispatch'):
+            event.listen(self, 'invalidate', self.count_invalidation)
+
+    def overflow_in_use(self):
+        return max(self.overflow(), 0) if isinstance(self, QueuePool) else 0
+
+    def _do_get(self):
+        overflow = self.overflow_in_use()
+        started = monotonic()
+
+        try:
+            connection = super()._do_get()
+
+        except exc.TimeoutError:
+            with self.metrics._lock:
+                self.metrics.timeouts += 1
+            raise
+
+        # a checkout that grew the overflow opened a connection past pool_size
+        self.metrics.checked_out(monotonic() - started, overflowed=self.overflow_in_use() > overflow)
+
+        return connection
+
+    def _do_return_conn(self, conn):
+        try:
+            super()._do_return_conn(conn)
+
+        finally:
+            with self.metrics._lock:
+                self.metrics.checkins += 1
+
+    def _create_connection(self):
+        connection = super()._create_connection()
+
+        with self.metrics._lock:
+            self.metrics.connects += 1
+
+        return connection
+
+    def count_invalidation(self, dbapi_connection, connection_record, exception):
+        # every invalidated connection, e.g. one a pre-ping found closed by the server,
+        # which invalidates its record without going through `Pool._invalidate`
+        with self.metrics._lock:
+            self.metrics.invalidations += 1
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def stats(self):
+        return {
+            "pool": type(self).__name__,
+            "size": self.size() if isinstance(self, QueuePool) else None,
+            "overflow": self.overflow_in_use(),
+            **self.metrics.stats()
+        }
+
+
+class InstrumentedQueuePool(InstrumentedPool, QueuePool):
+    pass
+
+
+class InstrumentedNullPool(InstrumentedPool, NullPool):
+    pass
+
+
+POOL_MODES = {
+    "queue": InstrumentedQueuePool,
+    "pgbouncer": InstrumentedNullPool
+}
+
+
+def engine_options(config):
+    """
+    (1) Builds the create_engine options from the DB_POOL_* config values.
+    (2) In 'pgbouncer' mode connections are opened and closed per checkout,
+        PgBouncer (transaction pooling) does the pooling, so the queue sizing
+        options are left out.
+    :param config: The app config.
+    :return: The SQLALCHEMY_ENGINE_OPTIONS dict.
+    """
+    mode = config.get('DB_POOL_MODE', 'queue')
+
+    if mode not in POOL_MODES:
+        raise ValueError(f"DB_POOL_MODE must be one of {', '.join(POOL_MODES)}, not {mode!r}")
+
+    options = {
+        "poolclass": POOL_MODES[mode],
+        "pool_pre_ping": config.get('DB_POOL_PRE_PING', True)
+    }
+
+    if mode == "queue":
+        options.update(
+            pool_size=config.get('DB_POOL_SIZE', 5),
+            max_overflow=config.get('DB_MAX_OVERFLOW', 10),
+            pool_timeout=config.get('DB_POOL_TIMEOUT', 30),
+            pool_recycle=config.get('DB_POOL_RECYCLE', 1800),
+            pool_use_lifo=True
+        )
+
+    return {**options, **config.get('SQLALCHEMY_ENGINE_OPTIONS', {})}
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    return pool.stats() if isinstance(pool, InstrumentedPool) else {"pool": type(pool).__name__, "status": pool.status()}
@@ -1,8 +1,9 @@
 from datetime import datetime
 from enum import Enum
 from flask_wtf import Form
-from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, TextAreaField
-from wtforms.validators import DataRequired, AnyOf, URL, Optional
+from wtforms import StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, TextAreaField, \
+    IntegerField
+from wtforms.validators import DataRequired, AnyOf, URL, Optional, NumberRange
 
 
 class State(Enum):
@@ -102,6 +103,12 @@ class ShowForm(Form):
         default=datetime.today()
     )
 
+    duration = IntegerField(
+        'duration',
+        validators=[DataRequired(), NumberRange(min=1, max=24 * 60)],
+        default=120
+    )
+
 
 class VenueForm(Form):
     name = StringField(
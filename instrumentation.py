@@ -0,0 +1,161 @@
+import heapq
+import json
+import random
+import re
+from time import perf_counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# literals and bind parameters that only differ between runs of the same statement
+LITERALS = re.compile(
+    r"""'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%\(\w+\)s|%s|\$\d+|\?"""
+)
+VALUE_LISTS = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+SPACES = re.compile(r"\s+")
+
+
+def statement_shape(statement):
+    """
+    (1) Reduces a statement to its shape, literals, bind parameters and
+        IN lists of any length become '?', so the queries of an N+1 loop
+        all share one shape
+    :param statement: (str) the SQL sent to the database
+    :return: (str) the shape
+    """
+    shape = LITERALS.sub('?', SPACES.sub(' ', statement).strip())
+    return VALUE_LISTS.sub('(?)', shape)
+
+
+class RequestQueries:
+
+    def __init__(self, slowest=5):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = {}
+        self.slowest = []
+        self._keep = slowest
+        self._started = perf_counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.duration += duration
+
+        shape = statement_shape(statement)
+        count, total = self.shapes.get(shape, (0, 0.0))
+        self.shapes[shape] = (count + 1, total + duration)
+
+        # a min-heap of the slowest statements seen so far
+        entry = (duration, self.count, shape)
+        if len(self.slowest) < self._keep:
+            heapq.heappush(self.slowest, entry)
+        elif duration > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, entry)
+
+    def repeated(self, threshold):
+        return sorted(
+            ((shape, count, total) for shape, (count, total) in self.shapes.items() if count >= threshold),
+            key=lambda item: item[1],
+            reverse=True
+        )
+
+    def report(self, threshold):
+        return {
+            "queries": self.count,
+            "db_ms": round(self.duration * 1000, 3),
+            "total_ms": round((perf_counter() - self._started) * 1000, 3),
+            "slowest": [
+                {"ms": round(duration * 1000, 3), "statement": shape}
+                for duration, order, shape in sorted(self.slowest, reverse=True)
+            ],
+            "repeated": [
+                {"count": count, "ms": round(total * 1000, 3), "statement": shape}
+                for shape, count, total in self.repeated(threshold)
+            ]
+        }
+
+
+def current_queries():
+    # queries run outside requests (CLI commands, background purges) aren't tracked
+    return g.get('sql_queries') if has_request_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if current_queries() is not None:
+        conn.info.setdefault('query_started', []).append(perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    queries = current_queries()
+
+    if queries is not None and conn.info.get('query_started'):
+        queries.record(statement, perf_counter() - conn.info['query_started'].pop())
+
+
+@event.listens_for(Engine, 'handle_error')
+def drop_query_timer(exception_context):
+    # a failed statement never reaches after_cursor_execute
+    started = exception_context.connection.info.get('query_started') if exception_context.connection else None
+
+    if started:
+        started.pop()
+
+
+class SQLInstrumentation:
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('SQL_INSTRUMENTATION', True)
+        self.slowest = app.config.get('SQL_SLOWEST_STATEMENTS', 5)
+        self.threshold = app.config.get('SQL_REPEATED_THRESHOLD', 5)
+        self.sample_rate = app.config.get('SQL_LOG_SAMPLE_RATE', 0.01)
+
+        if self.enabled:
+            app.before_request(self.start)
+            app.after_request(self.finish)
+
+    def start(self):
+        g.sql_queries = RequestQueries(slowest=self.slowest)
+
+    def finish(self, response):
+        """
+        (1) Adds the request's query count and database time to the response
+            headers, `X-Query-Count` and `Server-Timing` (shown by the
+            browser dev tools)
+        (2) Logs the full report, slowest and repeated statements included,
+            for a sample of the requests, and for every request repeating a
+            statement shape SQL_REPEATED_THRESHOLD times or more (N+1)
+        :param response: the response of the request
+        :return: the response
+        """
+        queries = g.pop('sql_queries', None)
+
+        if queries is None:
+            return response
+
+        report = queries.report(self.threshold)
+
+        response.headers['X-Query-Count'] = str(report.get('queries'))
+        response.headers.add(
+            'Server-Timing',
+            f'db;dur={report.get("db_ms")};desc="{report.get("queries")} queries", app;dur={report.get("total_ms")}'
+        )
+
+        if report.get('repeated') or random.random() < self.sample_rate:
+            log = self.app.logger.warning if report.get('repeated') else self.app.logger.info
+            log("sql %s", json.dumps({
+                "method": request.method,
+                "path": request.full_path.rstrip('?'),
+                "endpoint": request.endpoint,
+                "status": response.status_code,
+                **report
+            }))
+
+        return response
@@ -0,0 +1,190 @@
+import os
+from threading import Lock
+from time import perf_counter
+from flask import g, request
+from jinja2 import Template
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:  # pragma: no cover
+    prometheus_client = None
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+POOL_EVENTS = ('checkouts', 'connects', 'overflows', 'timeouts', 'invalidations')
+
+POOL_STATES = ('in_use', 'overflow')
+
+
+def multiprocess_dir():
+    # read by prometheus_client when it is imported, workers have to share it
+    return os.environ.get('PROMETHEUS_MULTIPROC_DIR') or os.environ.get('prometheus_multiproc_dir')
+
+
+class TimedTemplate(Template):
+    # set by `Metrics.init_app`, only pages are timed, extended and included templates render within them
+    histogram = None
+
+    def render(self, *args, **kwargs):
+        started = perf_counter()
+
+        try:
+            return super().render(*args, **kwargs)
+
+        finally:
+            if self.histogram is not None:
+                self.histogram.labels(self.name or 'string').observe(perf_counter() - started)
+
+
+class Totals:
+    """
+    Turns running totals kept by this process, like the pool and cache
+    counters, into increments of Prometheus counters.
+    """
+
+    def __init__(self):
+        self.last = {}
+        self._lock = Lock()
+
+    def update(self, counter, labels, total):
+        with self._lock:
+            increment = total - self.last.get((counter, labels), 0)
+            self.last[(counter, labels)] = total
+
+        child = counter.labels(*labels)
+
+        # a total that went down was reset, e.g. a recreated pool, it counts from zero again
+        if increment > 0:
+            child.inc(increment)
+
+
+class Metrics:
+
+    def __init__(self, app=None, engines=None, caches=None):
+        self.enabled = False
+
+        if app is not None:
+            self.init_app(app, engines, caches)
+
+    def init_app(self, app, engines=None, caches=None):
+        """
+        (1) Creates the metrics and hooks them to the app's requests and templates
+        :param engines: (callable) returning the engines to report pool stats of, by name
+        :param caches: (dict) of objects having a `stats()` method with 'hits' and 'misses', by name
+        """
+        self.enabled = prometheus_client is not None and app.config.get('METRICS_ENABLED', True)
+        self.engines = engines or (lambda: {})
+        self.caches = caches or {}
+        self.totals = Totals()
+
+        if not self.enabled:
+            return
+
+        self.registry = prometheus_client.CollectorRegistry()
+        registry = self.registry
+
+        self.request_seconds = prometheus_client.Histogram(
+            'fyyur_http_request_duration_seconds', 'Time spent handling requests.',
+            ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS, registry=registry
+        )
+        self.template_seconds = prometheus_client.Histogram(
+            'fyyur_template_render_duration_seconds', 'Time spent rendering page templates.',
+            ['template'], buckets=LATENCY_BUCKETS, registry=registry
+        )
+        self.db_failures = prometheus_client.Counter(
+            'fyyur_db_action_failures', 'DBActions fetch and change operations that failed and were rolled back.',
+            ['model', 'action', 'operation'], registry=registry
+        )
+        self.pool_events = prometheus_client.Counter(
+            'fyyur_db_pool_events', 'Connection pool checkouts, connects, overflows, timeouts and invalidations.',
+            ['bind', 'event'], registry=registry
+        )
+        self.pool_wait = prometheus_client.Counter(
+            'fyyur_db_pool_wait_seconds', 'Time spent waiting for a pooled connection.',
+            ['bind'], registry=registry
+        )
+        self.pool_connections = prometheus_client.Gauge(
+            'fyyur_db_pool_connections', 'Pooled connections checked out, and opened past the pool size.',
+            ['bind', 'state'], multiprocess_mode='livesum', registry=registry
+        )
+        self.cache_requests = prometheus_client.Counter(
+            'fyyur_cache_requests', 'Cache lookups, by result.',
+            ['cache', 'result'], registry=registry
+        )
+        self.cache_entries = prometheus_client.Gauge(
+            'fyyur_cache_entries', 'Entries held in memory by the caches.',
+            ['cache'], multiprocess_mode='livesum', registry=registry
+        )
+
+        TimedTemplate.histogram = self.template_seconds
+        app.jinja_env.template_class = TimedTemplate
+
+        app.before_request(self.start)
+        app.after_request(self.finish)
+
+    def start(self):
+        g.request_started = perf_counter()
+
+    def finish(self, response):
+        started = g.pop('request_started', None)
+
+        if started is not None:
+            self.request_seconds.labels(
+                request.endpoint or 'unmatched', request.method, response.status_code
+            ).observe(perf_counter() - started)
+
+        self.collect()
+
+        return response
+
+    def count_failure(self, cls, action, operation, error):
+        if self.enabled:
+            self.db_failures.labels(cls.__name__, action, operation).inc()
+
+    def collect(self):
+        """
+        (1) Copies this process' pool and cache stats into the metrics, done after
+            every request so each worker's share is current whichever one is scraped
+        """
+        for bind, engine in self.engines().items():
+            stats = getattr(engine.pool, 'stats', lambda: None)()
+
+            if not stats:
+                continue
+
+            for event in POOL_EVENTS:
+                self.totals.update(self.pool_events, (bind, event), stats.get(event, 0))
+
+            self.totals.update(self.pool_wait, (bind,), stats.get('wait_total', 0.0))
+
+            for state in POOL_STATES:
+                self.pool_connections.labels(bind, state).set(stats.get(state) or 0)
+
+        for name, cache in self.caches.items():
+            stats = cache.stats()
+            self.totals.update(self.cache_requests, (name, 'hit'), stats.get('hits', 0))
+            self.totals.update(self.cache_requests, (name, 'miss'), stats.get('misses', 0))
+
+            if 'size' in stats:
+                self.cache_entries.labels(name).set(stats.get('size'))
+
+    def exposition(self):
+        """
+        (1) Renders the metrics in the Prometheus text format, summed over every
+            worker process when PROMETHEUS_MULTIPROC_DIR is set
+        :return: (tuple) the body and its content type
+        """
+        registry = self.registry
+
+        if multiprocess_dir():
+            registry = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+
+        return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid):
+    # called from the server's worker exit hook, e.g. gunicorn's `child_exit`
+    if prometheus_client is not None and multiprocess_dir():
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,45 @@
+"""cascade show deletes from venues and artists in the database
+
+Revision ID: 0a9c7d3e5f12
+Revises: f3b86a1d52e4
+Create Date: 2026-10-18 15:02:41.530918
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '0a9c7d3e5f12'
+down_revision = 'f3b86a1d52e4'
+branch_labels = None
+depends_on = None
+
+
+FOREIGN_KEYS = (
+    ('Show_venue_id_fkey', 'venue_id', 'Venue'),
+    ('Show_artist_id_fkey', 'artist_id', 'Artist'),
+)
+
+
+def replace_foreign_keys(on_delete):
+    # NOT VALID skips the full table check while the ALTER holds its exclusive lock
+    for name, column, table in FOREIGN_KEYS:
+        op.execute(f'ALTER TABLE "Show" DROP CONSTRAINT IF EXISTS "{name}"')
+        op.execute(
+            f'ALTER TABLE "Show" ADD CONSTRAINT "{name}" FOREIGN KEY ({column}) '
+            f'REFERENCES "{table}" (id) {on_delete} NOT VALID'
+        )
+
+    # the exclusive lock is only released on commit, the check runs in its own transactions
+    # afterwards under a lock that lets reads and writes through
+    with op.get_context().autocommit_block():
+        for name, column, table in FOREIGN_KEYS:
+            op.execute(f'ALTER TABLE "Show" VALIDATE CONSTRAINT "{name}"')
+
+
+def upgrade():
+    replace_foreign_keys('ON DELETE CASCADE')
+
+
+def downgrade():
+    replace_foreign_keys('')
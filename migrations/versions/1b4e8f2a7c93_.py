@@ -0,0 +1,60 @@
+"""add show end times and exclude overlapping shows per venue and artist
+
+Revision ID: 1b4e8f2a7c93
+Revises: 0a9c7d3e5f12
+Create Date: 2026-10-18 15:47:12.284573
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1b4e8f2a7c93'
+down_revision = '0a9c7d3e5f12'
+branch_labels = None
+depends_on = None
+
+
+CONSTRAINTS = (
+    ('ex_Show_venue_id_during', 'venue_id'),
+    ('ex_Show_artist_id_during', 'artist_id'),
+)
+
+
+def upgrade():
+    # gist indexes on plain integer equality come with btree_gist
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+
+    # existing shows get the default two hours
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    op.execute('''UPDATE "Show" SET end_time = start_time + interval '2 hours' ''')
+    op.alter_column('Show', 'end_time', nullable=False)
+
+    connection = op.get_bind()
+
+    for name, column in CONSTRAINTS:
+        overlaps = connection.execute(sa.text(f'''
+            SELECT a.id, b.id FROM "Show" a JOIN "Show" b
+            ON a.{column} = b.{column} AND a.id < b.id
+            AND tsrange(a.start_time, a.end_time) && tsrange(b.start_time, b.end_time)
+            LIMIT 10
+        ''')).fetchall()
+
+        if overlaps:
+            raise RuntimeError(
+                f"Shows overlapping on the same {column} have to be moved or deleted first, "
+                f"e.g. (show id, show id): {', '.join(map(str, overlaps))}"
+            )
+
+        op.execute(
+            f'ALTER TABLE "Show" ADD CONSTRAINT "{name}" '
+            f'EXCLUDE USING gist ({column} WITH =, tsrange(start_time, end_time) WITH &&)'
+        )
+
+
+def downgrade():
+    for name, column in CONSTRAINTS:
+        op.drop_constraint(name, 'Show')
+
+    op.drop_column('Show', 'end_time')
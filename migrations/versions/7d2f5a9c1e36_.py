@@ -0,0 +1,37 @@
+"""add venue and artist pending purge tables
+
+Revision ID: 7d2f5a9c1e36
+Revises: 1b4e8f2a7c93
+Create Date: 2026-10-18 18:21:05.613847
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2f5a9c1e36'
+down_revision = '1b4e8f2a7c93'
+branch_labels = None
+depends_on = None
+
+
+PENDING_PURGES = (
+    ('VenuePendingPurge', 'Venue'),
+    ('ArtistPendingPurge', 'Artist'),
+)
+
+
+def upgrade():
+    for table, profile_table in PENDING_PURGES:
+        op.create_table(table,
+        sa.Column('profile_id', sa.Integer(), nullable=False),
+        sa.Column('requested_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['profile_id'], [f'{profile_table}.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('profile_id')
+        )
+
+
+def downgrade():
+    op.drop_table('ArtistPendingPurge')
+    op.drop_table('VenuePendingPurge')
@@ -0,0 +1,40 @@
+"""add trigram and prefix search indexes
+
+Revision ID: a4d27c61e8f3
+Revises: 5b9e0c3d7a21
+Create Date: 2026-10-18 11:03:17.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d27c61e8f3'
+down_revision = '5b9e0c3d7a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # pg_trgm ships with postgres contrib, creating it needs a role allowed to create extensions
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    for table in ('Venue', 'Artist'):
+        op.create_index(
+            f'ix_{table}_name_trgm',
+            table,
+            ['name'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'}
+        )
+        op.execute(
+            f'CREATE INDEX "ix_{table}_name_lower" ON "{table}" (lower(name) text_pattern_ops)'
+        )
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index(f'ix_{table}_name_lower', table_name=table)
+        op.drop_index(f'ix_{table}_name_trgm', table_name=table)
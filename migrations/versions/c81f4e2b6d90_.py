@@ -0,0 +1,28 @@
+"""add show access path indexes
+
+Revision ID: c81f4e2b6d90
+Revises: a4d27c61e8f3
+Create Date: 2026-10-18 11:47:05.310622
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f4e2b6d90'
+down_revision = 'a4d27c61e8f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # every profile page, count and conflict check filters on one side of the show and its start time;
+    # a partial "upcoming" index is not possible since now() is not immutable
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
@@ -0,0 +1,53 @@
+"""add venue and artist shows summary tables
+
+Revision ID: e25a9d04c7b1
+Revises: c81f4e2b6d90
+Create Date: 2026-10-18 12:36:52.904417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e25a9d04c7b1'
+down_revision = 'c81f4e2b6d90'
+branch_labels = None
+depends_on = None
+
+
+SUMMARIES = (
+    ('VenueShowsSummary', 'Venue', 'venue_id'),
+    ('ArtistShowsSummary', 'Artist', 'artist_id'),
+)
+
+
+def upgrade():
+    for table, profile_table, foreign_key in SUMMARIES:
+        op.create_table(table,
+        sa.Column('profile_id', sa.Integer(), nullable=False),
+        sa.Column('total_shows_count', sa.Integer(), nullable=False),
+        sa.Column('upcoming_shows_count', sa.Integer(), nullable=False),
+        sa.Column('next_show_time', sa.DateTime(), nullable=True),
+        sa.Column('last_show_time', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['profile_id'], [f'{profile_table}.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('profile_id')
+        )
+
+        # show times are naive local timestamps, so compare them against LOCALTIMESTAMP
+        op.execute(f"""
+            INSERT INTO "{table}"
+                (profile_id, total_shows_count, upcoming_shows_count, next_show_time, last_show_time)
+            SELECT {foreign_key},
+                   count(id),
+                   count(id) FILTER (WHERE start_time >= LOCALTIMESTAMP),
+                   min(start_time) FILTER (WHERE start_time >= LOCALTIMESTAMP),
+                   max(start_time) FILTER (WHERE start_time < LOCALTIMESTAMP)
+            FROM "Show"
+            GROUP BY {foreign_key}
+        """)
+
+
+def downgrade():
+    op.drop_table('ArtistShowsSummary')
+    op.drop_table('VenueShowsSummary')
@@ -0,0 +1,29 @@
+"""add updated_at to venues, artists and shows
+
+Revision ID: f3b86a1d52e4
+Revises: e25a9d04c7b1
+Create Date: 2026-10-18 13:58:29.117046
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b86a1d52e4'
+down_revision = 'e25a9d04c7b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist', 'Show'):
+        op.add_column(
+            table,
+            sa.Column('updated_at', sa.DateTime(), server_default=sa.text('LOCALTIMESTAMP'), nullable=False)
+        )
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        op.drop_column(table, 'updated_at')
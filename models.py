@@ -1,27 +1,92 @@
-from flask_sqlalchemy import SQLAlchemy
+import json
+from datetime import timedelta
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from itertools import groupby
+from operator import attrgetter
+from flask import g, has_app_context
+from sqlalchemy import event, exc
+from sqlalchemy.dialects.postgresql import ExcludeConstraint, insert as pg_insert
 from flask_migrate import Migrate
+from cache import SearchCache, SingleFlight
+from routing import RoutingSQLAlchemy
 from forms import *
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 migrate = Migrate(db=db)
+search_cache = SearchCache()
+search_flight = SingleFlight()
+
+
+def request_now():
+    # one "now" per request, so counts and past/upcoming partitions agree with each other
+    if not has_app_context():
+        return datetime.now()
+
+    if 'now' not in g:
+        g.now = datetime.now()
+
+    return g.now
+
+
+class InvalidArgument(ValueError):
+    # a request argument that could not be parsed, the client gets a 400, see `app.py`
+    pass
 
 
 class DBActionsExceptionsHandler:
 
-    def __init__(self, session):
+    def __init__(self, session, router=None):
         self.session = session
+        self.router = router
+        self.listeners = []
+        self.failure_listeners = []
+
+    def listen(self, listener):
+        self.listeners.append(listener)
+        return listener
+
+    def on_failure(self, listener):
+        self.failure_listeners.append(listener)
+        return listener
+
+    def failed(self, cls, action, operation, error):
+        # callers only get False back, listeners get to log and count what went wrong
+        for listener in self.failure_listeners:
+            listener(cls, action, operation, error)
+
+    def notify(self, cls, action, **kwargs):
+        # let caches and other listeners know what was committed
+        for listener in self.listeners:
+            listener(cls, action, **kwargs)
+
+    def committed(self, cls, action, **kwargs):
+        # after every write, the change operations' and the ones committing on their own
+        # (bookings, purges, imports), the writer's next reads go to the primary
+        if self.router:
+            self.router.stick()
+
+        self.notify(cls, action, **kwargs)
 
     def fetch(self, origin):
 
-        def wrapper(cls, **kwargs):
+        def wrapper(cls, on_primary=False, **kwargs):
+            # reads are allowed on a replica, see `routing.py`, unless they decide
+            # on a write that has to see the latest commits
+            info = self.session.info
+            route, info['route'] = info.get('route'), None if on_primary else 'read'
+
             try:
                 data = origin(cls, **kwargs)
                 return data
 
-            except BaseException:
+            except BaseException as error:
                 self.session.close()
+                self.failed(cls, origin.__name__, 'fetch', error)
                 return False
 
+            finally:
+                info['route'] = route
+
         return wrapper
 
     def change(self, origin):
@@ -31,21 +96,33 @@ class DBActionsExceptionsHandler:
             try:
                 origin(cls, **kwargs)
                 self.session.commit()
-                return True
 
-            except BaseException:
+            except BaseException as error:
                 self.session.rollback()
                 self.session.close()
+                self.failed(cls, origin.__name__, 'change', error)
                 return False
 
+            self.committed(cls, origin.__name__, **kwargs)
+
+            return True
+
         return wrapper
 
 
 class DBActions:
-    exception_handler = DBActionsExceptionsHandler(db.session)
+    exception_handler = DBActionsExceptionsHandler(db.session, db.router)
 
     session = exception_handler.session
 
+    per_page = 30
+
+    max_per_page = 100
+
+    search_limit = 20
+
+    prefix_search_length = 3
+
     @classmethod
     @exception_handler.fetch
     def get_one(cls, id):
@@ -64,6 +141,113 @@ class DBActions:
     def get_filtered(cls, loadonly=True, filter=True):
         return cls.query.options(loadonly).filter(filter).all()
 
+    @staticmethod
+    def cursor_token(value):
+        if isinstance(value, datetime):
+            return value.isoformat()
+
+        if isinstance(value, Enum):
+            return value.name
+
+        return value
+
+    @staticmethod
+    def encode_cursor(values):
+        return urlsafe_b64encode(
+            json.dumps([DBActions.cursor_token(v) for v in values]).encode()
+        ).decode().rstrip('=')
+
+    @staticmethod
+    def cursor_value(sort_key, value):
+        # the reverse of `cursor_token`, checked against the type of the sort key
+        if value is None:
+            return None
+
+        if isinstance(sort_key.type, db.Enum):
+            return sort_key.type.enum_class[value]
+
+        if isinstance(sort_key.type, db.DateTime):
+            return datetime.fromisoformat(value)
+
+        if not isinstance(value, sort_key.type.python_type):
+            raise TypeError(f"{sort_key.key} has to be a {sort_key.type.python_type.__name__}")
+
+        return value
+
+    @staticmethod
+    def decode_cursor(token, sort_keys):
+        """
+        (1) Reads the sort key values of the row a page starts after
+        :return: (list) of values, raises InvalidArgument when the token is not
+                 a cursor of these sort keys
+        """
+        try:
+            values = json.loads(urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+
+            if not isinstance(values, list) or len(values) != len(sort_keys):
+                raise ValueError("cursor does not match the sort keys")
+
+            return [DBActions.cursor_value(k, v) for k, v in zip(sort_keys, values)]
+
+        except (ValueError, TypeError, KeyError):
+            raise InvalidArgument("invalid cursor") from None
+
+    @staticmethod
+    def row_values(row, sort_keys):
+        # rows of entity queries carry the entity first, e.g. (Venue, upcoming_shows_count, ...)
+        return tuple(getattr(row, k.key) if hasattr(row, k.key) else getattr(row[0], k.key) for k in sort_keys)
+
+    @classmethod
+    def get_page(cls, query, sort_keys, cursor=None, per_page=None):
+        # a malformed cursor raises InvalidArgument here, before anything is queried,
+        # rather than failing the fetch like a database error would
+        return cls.fetch_page(
+            query=query,
+            sort_keys=sort_keys,
+            cursor=cursor,
+            after=cls.decode_cursor(cursor, sort_keys) if cursor else None,
+            per_page=per_page
+        )
+
+    @classmethod
+    @exception_handler.fetch
+    def fetch_page(cls, query, sort_keys, cursor=None, after=None, per_page=None):
+        per_page = min(max(per_page or cls.per_page, 1), cls.max_per_page)
+
+        # seek past the last row of the previous page instead of counting an OFFSET
+        if after is not None:
+            query = query.filter(
+                db.tuple_(*sort_keys) > db.tuple_(
+                    *[db.literal(v, k.type) for k, v in zip(sort_keys, after)]
+                )
+            )
+
+        rows = query.order_by(*sort_keys).limit(per_page + 1).all()
+
+        return {
+            "data": rows[:per_page],
+            "cursor": cursor,
+            "next_cursor": cls.encode_cursor(
+                cls.row_values(rows[per_page - 1], sort_keys)
+            ) if len(rows) > per_page else None,
+            "per_page": per_page
+        }
+
+    @classmethod
+    @exception_handler.fetch
+    def get_one_from(cls, query, id):
+        return query.filter(cls.id == id).first()
+
+    @classmethod
+    @exception_handler.fetch
+    def get_count(cls, filter=None):
+        query = cls.session.query(db.func.count(cls.id))
+
+        if filter is not None:
+            query = query.filter(filter)
+
+        return query.scalar()
+
     @classmethod
     @exception_handler.change
     def add(cls, object_model=None, **kwargs):
@@ -91,58 +275,205 @@ class DBActions:
         cls.session.delete(object_model)
 
     @staticmethod
-    def group_by_common(ilist, common_fields, group_name):
-        def comp_factor(d, t):
-            return tuple(d.__dict__.get(f) for f in t)
+    def common_key(common_fields):
+        getter = attrgetter(*common_fields)
 
-        return [
-            {
-                **dict(zip(common_fields, d1)),
-                **{
-                    group_name: [
-                        d2 for d2 in ilist if comp_factor(d2, common_fields) == d1
-                    ]
+        if len(common_fields) == 1:
+            return lambda d: (getter(d),)
+
+        return getter
+
+    @staticmethod
+    def sort_token(value):
+        if isinstance(value, Enum):
+            return value.value
+
+        return value
+
+    @staticmethod
+    def iter_group_by_common(ilist, common_fields, group_name, order_fields=None, presorted=False):
+        key_of = DBActions.common_key(common_fields)
+
+        # rows already ordered by the common fields are grouped while streaming
+        if presorted:
+            for key, group in groupby(ilist, key=key_of):
+                yield {
+                    **dict(zip(common_fields, key)),
+                    group_name: list(group)
                 }
+
+            return
+
+        groups = {}
+
+        for d in ilist:
+            groups.setdefault(key_of(d), []).append(d)
+
+        positions = [common_fields.index(f) for f in (order_fields or common_fields)]
+
+        for key in sorted(
+                groups,
+                key=lambda k: tuple(DBActions.sort_token(k[p]) for p in positions)
+        ):
+            yield {
+                **dict(zip(common_fields, key)),
+                group_name: groups[key]
             }
-            for d1
-            in
-            set(
-                comp_factor(d, common_fields) for d in ilist
+
+    @staticmethod
+    def group_by_common(ilist, common_fields, group_name, order_fields=None):
+        return list(
+            DBActions.iter_group_by_common(
+                ilist,
+                common_fields,
+                group_name,
+                order_fields=order_fields
             )
-        ]
+        )
+
+    @staticmethod
+    def normalize_term(keyword):
+        return " ".join((keyword or "").split())
+
+    @staticmethod
+    def escape_like(term):
+        return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
 
     @classmethod
-    def search(cls, keyword):
-        results = cls.get_filtered(
-            loadonly=
-            db.load_only(
-                cls.id,
-                cls.name
+    def search_filter(cls, term):
+        pattern = cls.escape_like(term.lower())
+
+        # short terms make poor trigrams, so autocomplete goes through the lower(name) prefix index
+        if len(term) < cls.prefix_search_length:
+            return db.func.lower(cls.name).like(f"{pattern}%", escape="\\")
+
+        # longer terms use the name trigram index
+        return cls.name.ilike(f"%{pattern}%", escape="\\")
+
+    @classmethod
+    def search_rank(cls, term):
+        return (
+            db.case(
+                [(db.func.lower(cls.name).like(f"{cls.escape_like(term.lower())}%", escape="\\"), 0)],
+                else_=1
             ),
-            filter=
-            cls.name.ilike(
-                f"%{keyword}%"
-            )
+            db.func.similarity(cls.name, term).desc(),
+            cls.name,
+            cls.id
         )
 
+    @classmethod
+    def run_search(cls, term, limit):
+        search_filter = cls.search_filter(term)
+
+        results = cls.get_all_counted(
+            filter=search_filter,
+            order_by=cls.search_rank(term),
+            limit=limit
+        )
+
+        if results is False:
+            return None
+
+        # only a full page of results needs a separate count
+        count = len(results)
+
+        if count >= limit:
+            count = cls.get_count(filter=search_filter) or count
+
         return {
-            "search_term": keyword,
-            "status": "found" if results else "not_found",
-            "count": len(results) if results else 0,
+            "count": count,
             "results": [
                 {
                     "id": result.id,
                     "name": result.name,
                     "upcoming_shows_count": result.upcoming_shows_count
-                } for result in (results if results else [])]
+                } for result in results]
+        }
+
+    @classmethod
+    def run_cached_search(cls, key, term, limit):
+        found = cls.run_search(term, limit)
+
+        # a replica may not have the rows of a write invalidated moments ago, see `routing.py`
+        if found is not None and not db.router.may_be_stale(search_cache.invalidated_at):
+            search_cache.set(key, found)
+
+        return found
+
+    @classmethod
+    def parse_limit(cls, value):
+        """
+        (1) Reads a limit sent by a client, as a number or a numeric string
+        :return: (int) the limit, at most max_per_page, None when not given,
+                 raises InvalidArgument when it is not a positive whole number
+        """
+        if value is None:
+            return None
+
+        try:
+            limit = int(str(value).strip())
+
+        except ValueError:
+            raise InvalidArgument("'limit' has to be a whole number") from None
+
+        if limit < 1:
+            raise InvalidArgument("'limit' has to be at least 1")
+
+        return min(limit, cls.max_per_page)
+
+    @classmethod
+    def search(cls, keyword, limit=None):
+        term = cls.normalize_term(keyword)
+        limit = min(max(limit or cls.search_limit, 1), cls.max_per_page)
+
+        # the key holds the generation the query starts under, a write committed while
+        # it runs bumps the generation, so the result it stores is never served
+        key = search_cache.key(cls, term, limit)
+        found = search_cache.get(key)
+
+        # concurrent misses for the same search share one query
+        if found is None:
+            found = search_flight.do(key, lambda: cls.run_cached_search(key, term, limit))
+
+        results = found.get("results") if found else []
+
+        return {
+            "search_term": keyword,
+            "status": "found" if results else "not_found",
+            "count": found.get("count") if found else 0,
+            "limit": limit,
+            "results": results
         }
 
+    @staticmethod
+    def changed_models(cls, **kwargs):
+        models = {cls}
+
+        if kwargs.get("object_model") is not None:
+            models.add(type(kwargs.get("object_model")))
+
+        models.update(type(om) for om in kwargs.get("object_models") or ())
+
+        return models
+
     @classmethod
-    def delete_ajaxly(cls, object_model, redir1, redir2):
+    def delete_ajaxly(cls, object_model, redir1, redir2, purge_later=False):
         cached = {
             'name': object_model.name
         }
 
+        # very large profiles are purged in batches outside the request, see `Profile.purge`
+        if purge_later:
+            status = cls.schedule_purge(id=object_model.id)
+
+            return {
+                'status': 'scheduled' if status else 'failed',
+                'type': 'venue',
+                'name': cached.get('name'),
+                'redirection': redir1 if status else redir2
+            }
+
         status = cls.remove(object_model=object_model)
 
         return {
@@ -153,6 +484,205 @@ class DBActions:
         }
 
 
+class ShowsSummary(DBActions):
+    total_shows_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+
+    upcoming_shows_count = db.Column(
+        db.Integer,
+        nullable=False,
+        default=0
+    )
+
+    next_show_time = db.Column(
+        db.DateTime
+    )
+
+    last_show_time = db.Column(
+        db.DateTime
+    )
+
+    shows_foreign_key = None
+
+    @classmethod
+    def add_show(cls, connection, profile_id, start_time, now):
+        table = cls.__table__
+        upcoming = start_time >= now
+
+        statement = pg_insert(table).values(
+            profile_id=profile_id,
+            total_shows_count=1,
+            upcoming_shows_count=1 if upcoming else 0,
+            next_show_time=start_time if upcoming else None,
+            last_show_time=None if upcoming else start_time
+        )
+
+        # least() and greatest() skip nulls, so the times only move towards the new show
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=[table.c.profile_id],
+                set_={
+                    'total_shows_count': table.c.total_shows_count + 1,
+                    'upcoming_shows_count': table.c.upcoming_shows_count + statement.excluded.upcoming_shows_count,
+                    'next_show_time': db.func.least(table.c.next_show_time, statement.excluded.next_show_time),
+                    'last_show_time': db.func.greatest(table.c.last_show_time, statement.excluded.last_show_time)
+                }
+            )
+        )
+
+    @classmethod
+    def shows_subquery(cls, column, *criteria):
+        return db.select(
+            [column]
+        ).where(
+            db.and_(getattr(Show, cls.shows_foreign_key) == cls.profile_id, *criteria)
+        ).as_scalar()
+
+    @classmethod
+    def refresh_statement(cls, now, filter):
+        # recompute the given rows from their shows, each subquery is one range scan on the show indexes
+        return cls.__table__.update().where(filter).values(
+            total_shows_count=cls.shows_subquery(db.func.count(Show.id)),
+            upcoming_shows_count=cls.shows_subquery(db.func.count(Show.id), Show.start_time >= now),
+            next_show_time=cls.shows_subquery(db.func.min(Show.start_time), Show.start_time >= now),
+            last_show_time=cls.shows_subquery(db.func.max(Show.start_time), Show.start_time < now)
+        )
+
+    @classmethod
+    def refresh(cls, connection, profile_ids, now):
+        if not profile_ids:
+            return
+
+        connection.execute(
+            cls.refresh_statement(now, cls.profile_id.in_(list(profile_ids)))
+        )
+
+    @classmethod
+    @DBActions.exception_handler.change
+    def roll(cls):
+        # only rows whose next show has started since they were last touched are out of date
+        now = datetime.now()
+
+        cls.session.execute(
+            cls.refresh_statement(now, cls.next_show_time <= now)
+        )
+
+    summary_columns = (
+        'profile_id',
+        'total_shows_count',
+        'upcoming_shows_count',
+        'next_show_time',
+        'last_show_time'
+    )
+
+    @classmethod
+    def summary_select(cls, now):
+        foreign_key = getattr(Show, cls.shows_foreign_key)
+
+        return db.select([
+            foreign_key,
+            db.func.count(Show.id),
+            db.func.count(Show.id).filter(Show.start_time >= now),
+            db.func.min(Show.start_time).filter(Show.start_time >= now),
+            db.func.max(Show.start_time).filter(Show.start_time < now)
+        ]).group_by(foreign_key)
+
+    @classmethod
+    def recount(cls, connection, profile_ids, now):
+        # like refresh, but also creates the rows of profiles that had no shows yet
+        statement = pg_insert(cls.__table__).from_select(
+            cls.summary_columns,
+            cls.summary_select(now).where(
+                getattr(Show, cls.shows_foreign_key).in_(list(profile_ids))
+            )
+        )
+
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=[cls.__table__.c.profile_id],
+                set_={c: statement.excluded[c] for c in cls.summary_columns[1:]}
+            )
+        )
+
+    @classmethod
+    @DBActions.exception_handler.change
+    def rebuild(cls):
+        now = datetime.now()
+
+        cls.session.execute(cls.__table__.delete())
+        cls.session.execute(
+            cls.__table__.insert().from_select(
+                cls.summary_columns,
+                cls.summary_select(now)
+            )
+        )
+
+
+class VenueShowsSummary(db.Model, ShowsSummary):
+    __tablename__ = 'VenueShowsSummary'
+
+    profile_id = db.Column(
+        db.Integer,
+        db.ForeignKey("Venue.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+
+    shows_foreign_key = 'venue_id'
+
+
+class ArtistShowsSummary(db.Model, ShowsSummary):
+    __tablename__ = 'ArtistShowsSummary'
+
+    profile_id = db.Column(
+        db.Integer,
+        db.ForeignKey("Artist.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+
+    shows_foreign_key = 'artist_id'
+
+
+class PendingPurge(DBActions):
+    requested_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.now
+    )
+
+    @classmethod
+    def ids(cls, connection):
+        return [
+            row[0] for row in connection.execute(
+                db.select([cls.profile_id]).order_by(cls.requested_at, cls.profile_id)
+            )
+        ]
+
+
+class VenuePendingPurge(db.Model, PendingPurge):
+    __tablename__ = 'VenuePendingPurge'
+
+    # removed along with the venue, in the transaction that finishes its purge
+    profile_id = db.Column(
+        db.Integer,
+        db.ForeignKey("Venue.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+
+
+class ArtistPendingPurge(db.Model, PendingPurge):
+    __tablename__ = 'ArtistPendingPurge'
+
+    # removed along with the artist, in the transaction that finishes its purge
+    profile_id = db.Column(
+        db.Integer,
+        db.ForeignKey("Artist.id", ondelete="CASCADE"),
+        primary_key=True
+    )
+
+
 class Profile(DBActions):
     id = db.Column(
         db.Integer,
@@ -209,28 +739,269 @@ class Profile(DBActions):
         db.String()
     )
 
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.now,
+        onupdate=datetime.now,
+        server_default=db.text('LOCALTIMESTAMP')
+    )
+
     shows = None
 
+    shows_foreign_key = None
+
+    shows_counterpart = None
+
+    shows_summary = None
+
+    pending_purge = None
+
+    @staticmethod
+    def counts_columns(now):
+        return (
+            db.func.count(
+                db.case([(Show.start_time >= now, Show.id)])
+            ).label('upcoming_shows_count'),
+            db.func.count(
+                db.case([(Show.start_time < now, Show.id)])
+            ).label('past_shows_count')
+        )
+
+    @classmethod
+    def summary_counts_columns(cls, now):
+        summary = cls.shows_summary
+
+        # a row whose next show already started is recounted until the roll job catches it up
+        upcoming = db.func.coalesce(
+            db.case(
+                [(
+                    summary.next_show_time <= now,
+                    summary.shows_subquery(db.func.count(Show.id), Show.start_time >= now)
+                )],
+                else_=summary.upcoming_shows_count
+            ),
+            0
+        )
+
+        return (
+            upcoming.label('upcoming_shows_count'),
+            (db.func.coalesce(summary.total_shows_count, 0) - upcoming).label('past_shows_count')
+        )
+
+    @classmethod
+    def counted_query(cls, filter=None):
+        summary = cls.shows_summary
+
+        query = cls.session.query(
+            cls.id,
+            cls.name,
+            cls.city,
+            cls.state,
+            cls.updated_at,
+            *cls.summary_counts_columns(request_now()),
+            summary.next_show_time
+        ).outerjoin(
+            summary,
+            summary.profile_id == cls.id
+        )
+
+        if filter is not None:
+            query = query.filter(filter)
+
+        return query
+
+    @classmethod
+    def api_query(cls, load_only):
+        summary = cls.shows_summary
+
+        return cls.session.query(
+            cls,
+            *cls.summary_counts_columns(request_now()),
+            summary.next_show_time
+        ).outerjoin(
+            summary,
+            summary.profile_id == cls.id
+        ).options(
+            load_only
+        )
+
+    @classmethod
+    @DBActions.exception_handler.fetch
+    def get_all_counted(cls, filter=None, order_by=None, limit=None):
+        return cls.counted_query(filter=filter).order_by(*(order_by or (cls.name, cls.id))).limit(limit).all()
+
+    @classmethod
+    def counterpart(cls):
+        return getattr(Show, cls.shows_counterpart).property.mapper.class_
+
+    @classmethod
+    @DBActions.exception_handler.fetch
+    def get_version(cls, id):
+        counterpart = cls.counterpart()
+
+        # everything the profile page renders, without loading the shows themselves
+        return cls.session.query(
+            cls.updated_at,
+            db.func.max(Show.updated_at).label('shows_updated_at'),
+            db.func.max(counterpart.updated_at).label('counterparts_updated_at'),
+            *cls.counts_columns(request_now())
+        ).outerjoin(
+            Show,
+            getattr(Show, cls.shows_foreign_key) == cls.id
+        ).outerjoin(
+            counterpart,
+            getattr(Show, counterpart.shows_foreign_key) == counterpart.id
+        ).filter(
+            cls.id == id
+        ).group_by(
+            cls.id
+        ).first()
+
+    @classmethod
+    def counterpart_ids(cls, connection, id):
+        return {
+            row[0] for row in connection.execute(
+                db.select([getattr(Show, cls.counterpart().shows_foreign_key)]).where(
+                    getattr(Show, cls.shows_foreign_key) == id
+                ).distinct()
+            )
+        }
+
+    @classmethod
+    def purge_batch(cls, connection, id, batch_size):
+        """
+        (1) Deletes up to batch_size of the profile's shows with one statement
+        (2) Recounts the summaries of the profile and of the counterparts that lost shows
+        :return: (int) the number of shows deleted
+        """
+        show = Show.__table__
+        foreign_key = show.c[cls.shows_foreign_key]
+        counterpart = cls.counterpart()
+
+        deleted = connection.execute(
+            show.delete().where(
+                show.c.id.in_(db.select([show.c.id]).where(foreign_key == id).limit(batch_size))
+            ).returning(show.c[counterpart.shows_foreign_key])
+        ).fetchall()
+
+        now = datetime.now()
+        cls.shows_summary.refresh(connection, [id], now)
+        counterpart.shows_summary.refresh(connection, {row[0] for row in deleted}, now)
+
+        return len(deleted)
+
+    @classmethod
+    def purge(cls, id, batch_size=5000, engine=None):
+        """
+        (1) Deletes the profile's shows batch by batch, each batch in its own
+            short transaction, so no lock is held for the whole delete
+        (2) Deletes the profile itself once it has no shows left
+        :param id: (int) of the profile
+        :param batch_size: (int) shows deleted per transaction
+        :param engine: the engine to run on, the app's by default
+        :return: (int) the number of shows deleted
+        """
+        engine = engine or db.engine
+        total = 0
+
+        while True:
+            with engine.begin() as connection:
+                deleted = cls.purge_batch(connection, id, batch_size)
+
+            total += deleted
+
+            if deleted < batch_size:
+                break
+
+        with engine.begin() as connection:
+            connection.execute(cls.__table__.delete().where(cls.__table__.c.id == id))
+
+        # listeners only need the id of what was removed
+        cls.exception_handler.committed(cls, 'remove', object_model=cls(id=id))
+
+        return total
+
+    @classmethod
+    @DBActions.exception_handler.change
+    def schedule_purge(cls, id):
+        # a purge outlives the request and the worker, `flask purge-pending` runs it
+        statement = pg_insert(cls.pending_purge.__table__).values(profile_id=id, requested_at=datetime.now())
+        cls.session.execute(statement.on_conflict_do_nothing())
+
+    @classmethod
+    def purge_pending(cls, batch_size=5000, engine=None):
+        """
+        (1) Purges the profiles scheduled by `schedule_purge`, oldest first
+        (2) An interrupted purge is picked up again from the shows it left,
+            its profile stays scheduled until the profile itself is deleted
+        :return: (dict) of the number of shows deleted, by profile id
+        """
+        engine = engine or db.engine
+
+        with engine.connect() as connection:
+            ids = cls.pending_purge.ids(connection)
+
+        return {id: cls.purge(id, batch_size=batch_size, engine=engine) for id in ids}
+
+    _shows_partition = None
+
+    _shows_counts = None
+
+    def load_shows(self):
+        if self._shows_partition is None:
+            now = request_now()
+            partition = {
+                'past': [],
+                'upcoming': []
+            }
+
+            # one query for all the shows, with the other side of each show eager-loaded
+            for show in self.shows.options(
+                    db.joinedload(getattr(Show, self.shows_counterpart))
+            ).order_by(Show.start_time, Show.id):
+                partition['upcoming' if show.start_time >= now else 'past'].append(show)
+
+            self._shows_partition = partition
+
+        return self._shows_partition
+
+    @property
+    def shows_counts(self):
+        if self._shows_counts is None:
+            self._shows_counts = self.session.query(
+                *self.counts_columns(request_now())
+            ).filter(
+                getattr(Show, self.shows_foreign_key) == self.id
+            ).one()
+
+        return self._shows_counts
+
     @property
     def past_shows(self):
-        return self.shows.filter(Show.start_time < datetime.now()).all()
+        return self.load_shows().get('past')
 
     @property
     def past_shows_count(self):
-        return len(self.past_shows)
+        return self.shows_counts.past_shows_count
 
     @property
     def upcoming_shows(self):
-        return self.shows.filter(Show.start_time >= datetime.now()).all()
+        return self.load_shows().get('upcoming')
 
     @property
     def upcoming_shows_count(self):
-        return len(self.upcoming_shows)
+        return self.shows_counts.upcoming_shows_count
 
 
 class Venue(db.Model, Profile):
     __tablename__ = 'Venue'
 
+    __table_args__ = (
+        db.Index('ix_Venue_state_city_name_id', 'state', 'city', 'name', 'id'),
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
+
     address = db.Column(
         db.String(120),
         nullable=False
@@ -242,32 +1013,91 @@ class Venue(db.Model, Profile):
         default=False
     )
 
+    shows_foreign_key = 'venue_id'
+
+    shows_counterpart = 'artist'
+
+    shows_summary = VenueShowsSummary
+
+    pending_purge = VenuePendingPurge
+
+    # the database deletes the shows along with the profile, see `purge` for very large ones
     shows = db.relationship(
         "Show",
         cascade="all, delete-orphan",
-        lazy="dynamic"
+        lazy="dynamic",
+        passive_deletes=True
     )
 
 
 class Artist(db.Model, Profile):
     __tablename__ = 'Artist'
 
+    __table_args__ = (
+        db.Index('ix_Artist_name_id', 'name', 'id'),
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
+
     seeking_venue = db.Column(
         db.Boolean,
         nullable=False,
         default=False
     )
 
+    shows_foreign_key = 'artist_id'
+
+    shows_counterpart = 'venue'
+
+    shows_summary = ArtistShowsSummary
+
+    pending_purge = ArtistPendingPurge
+
+    # the database deletes the shows along with the profile, see `purge` for very large ones
     shows = db.relationship(
         "Show",
         cascade="all, delete-orphan",
-        lazy="dynamic"
+        lazy="dynamic",
+        passive_deletes=True
     )
 
 
+db.Index(
+    'ix_Venue_name_lower',
+    db.func.lower(Venue.name).label('name_lower'),
+    postgresql_ops={'name_lower': 'text_pattern_ops'}
+)
+
+db.Index(
+    'ix_Artist_name_lower',
+    db.func.lower(Artist.name).label('name_lower'),
+    postgresql_ops={'name_lower': 'text_pattern_ops'}
+)
+
+
 class Show(db.Model, DBActions):
     __tablename__ = 'Show'
 
+    __table_args__ = (
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+        # a venue hosts, and an artist plays, one show at a time
+        ExcludeConstraint(
+            ('venue_id', '='),
+            (db.func.tsrange(db.column('start_time'), db.column('end_time')), '&&'),
+            name='ex_Show_venue_id_during',
+            using='gist'
+        ),
+        ExcludeConstraint(
+            ('artist_id', '='),
+            (db.func.tsrange(db.column('start_time'), db.column('end_time')), '&&'),
+            name='ex_Show_artist_id_during',
+            using='gist'
+        ),
+    )
+
+    default_duration = timedelta(hours=2)
+
     id = db.Column(
         db.Integer,
         primary_key=True
@@ -275,13 +1105,13 @@ class Show(db.Model, DBActions):
 
     venue_id = db.Column(
         db.Integer,
-        db.ForeignKey("Venue.id"),
+        db.ForeignKey("Venue.id", ondelete="CASCADE"),
         nullable=False
     )
 
     artist_id = db.Column(
         db.Integer,
-        db.ForeignKey("Artist.id"),
+        db.ForeignKey("Artist.id", ondelete="CASCADE"),
         nullable=False
     )
 
@@ -290,12 +1120,337 @@ class Show(db.Model, DBActions):
         nullable=False
     )
 
+    end_time = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=lambda context: context.get_current_parameters()['start_time'] + Show.default_duration
+    )
+
+    updated_at = db.Column(
+        db.DateTime,
+        nullable=False,
+        default=datetime.now,
+        onupdate=datetime.now,
+        server_default=db.text('LOCALTIMESTAMP')
+    )
+
     venue = db.relationship(
         "Venue",
-        backref=db.backref("artists")
+        backref=db.backref("artists", passive_deletes='all')
     )
 
     artist = db.relationship(
         "Artist",
-        backref=db.backref("venues")
+        backref=db.backref("venues", passive_deletes='all')
+    )
+
+    @classmethod
+    def listing_query(cls):
+        return cls.session.query(
+            cls.id,
+            cls.venue_id,
+            cls.artist_id,
+            cls.start_time,
+            Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link'),
+            Venue.name.label('venue_name'),
+            db.func.greatest(cls.updated_at, Artist.updated_at, Venue.updated_at).label('updated_at')
+        ).join(
+            Artist,
+            cls.artist_id == Artist.id
+        ).join(
+            Venue,
+            cls.venue_id == Venue.id
+        )
+
+    @classmethod
+    @DBActions.exception_handler.fetch
+    def get_conflict(cls, venue_id, artist_id, start_time, end_time):
+        # one scan of each exclusion constraint's gist index, OR-ed together
+        return cls.session.query(cls).filter(
+            db.or_(cls.venue_id == venue_id, cls.artist_id == artist_id),
+            db.func.tsrange(cls.start_time, cls.end_time).op('&&')(db.func.tsrange(start_time, end_time))
+        ).order_by(
+            cls.start_time,
+            cls.id
+        ).first()
+
+    @classmethod
+    @DBActions.exception_handler.fetch
+    def resolve_profiles(cls, venue_ids, artist_ids):
+        # which of the ids exist, both tables in one round trip
+        found = cls.session.execute(
+            db.union_all(
+                db.select([db.literal('venue_id').label('column'), Venue.id]).where(Venue.id.in_(venue_ids)),
+                db.select([db.literal('artist_id').label('column'), Artist.id]).where(Artist.id.in_(artist_ids))
+            )
+        )
+
+        resolved = {'venue_id': set(), 'artist_id': set()}
+
+        for column, id in found:
+            resolved[column].add(id)
+
+        return resolved
+
+    @classmethod
+    @DBActions.exception_handler.fetch
+    def batch_conflicts(cls, entries):
+        """
+        (1) Finds, in one query, the entries overlapping an existing show at
+            the same venue or with the same artist, and the entries overlapping
+            an earlier entry of the same batch
+        (2) Goes through the entries in order, an entry only conflicts with
+            the earlier ones that are booked themselves
+        :param entries: (dict) of position to a dict holding 'venue_id', 'artist_id',
+                        'start_time' and 'end_time'
+        :return: (dict) of position to ('show', show id) or ('entry', position)
+        """
+        positions = sorted(entries)
+
+        found = cls.session.execute(
+            BATCH_CONFLICTS,
+            {
+                "positions": positions,
+                **{
+                    f"{column}s": [entries[p][column] for p in positions]
+                    for column in ('venue_id', 'artist_id', 'start_time', 'end_time')
+                }
+            }
+        )
+
+        shows = {}
+        earlier = {}
+
+        for position, show_id, other_position in found:
+            if show_id is not None:
+                shows.setdefault(position, show_id)
+
+            else:
+                earlier.setdefault(position, []).append(other_position)
+
+        conflicts = {}
+
+        for position in positions:
+            if position in shows:
+                conflicts[position] = ('show', shows[position])
+                continue
+
+            booked = [p for p in earlier.get(position, ()) if p not in conflicts]
+
+            if booked:
+                conflicts[position] = ('entry', booked[0])
+
+        return conflicts
+
+    @classmethod
+    @DBActions.exception_handler.fetch
+    def get_booked(cls, ids):
+        # the shows just booked, with what the listeners need to know about them
+        return cls.session.query(cls).options(
+            db.joinedload(cls.venue)
+        ).filter(
+            cls.id.in_(ids)
+        ).all()
+
+    @classmethod
+    def book(cls, entries, atomic=False):
+        """
+        (1) Resolves the venues and artists of every entry with one query
+        (2) Checks every entry against the existing shows and the batch with one query
+        (3) Inserts the entries that passed with one statement in one transaction,
+            recounting the summaries of the venues and artists involved
+        :param entries: (dict) of position to a dict holding 'venue_id', 'artist_id',
+                        'start_time' and 'end_time'
+        :param atomic: (bool) insert nothing unless every entry passes
+        :return: (dict) of position to result dict holding 'status' and
+                 'show_id' on 'created', 'error' otherwise
+        """
+        results = {}
+
+        # the checks decide on a write, a replica could be missing recent venues, artists and shows
+        resolved = cls.resolve_profiles(
+            on_primary=True,
+            venue_ids={e['venue_id'] for e in entries.values()},
+            artist_ids={e['artist_id'] for e in entries.values()}
+        )
+
+        if resolved is False:
+            return {p: {"status": "failed", "error": "the booking could not be completed"} for p in entries}
+
+        for position, entry in entries.items():
+            missing = [c for c in ('venue_id', 'artist_id') if entry[c] not in resolved[c]]
+
+            if missing:
+                results[position] = {
+                    "status": "not_found",
+                    "error": ", ".join(f"{c.split('_')[0]} {entry[c]} does not exist" for c in missing)
+                }
+
+        # a concurrent booking can still take a time between the check and the insert,
+        # the exclusion constraints then reject the insert and the check runs again
+        for attempt in range(2):
+            bookable = {p: e for p, e in entries.items() if p not in results}
+            conflicts = cls.batch_conflicts(on_primary=True, entries=bookable) if bookable else {}
+
+            if conflicts is False:
+                break
+
+            for position, (kind, other) in conflicts.items():
+                results[position] = {
+                    "status": "conflict",
+                    "error": f"overlaps show {other}" if kind == 'show' else f"overlaps entry {other} of this batch",
+                    f"conflicting_{kind}": other
+                }
+
+            bookable = {p: e for p, e in bookable.items() if p not in conflicts}
+
+            if not bookable or atomic and len(bookable) < len(entries):
+                for position in bookable:
+                    results[position] = {"status": "skipped", "error": "other entries of the batch failed"}
+
+                return results
+
+            try:
+                inserted = cls.session.execute(
+                    cls.__table__.insert().values(list(bookable.values())).returning(
+                        cls.id, cls.venue_id, cls.start_time
+                    )
+                ).fetchall()
+
+                now = datetime.now()
+                VenueShowsSummary.recount(cls.session, {e['venue_id'] for e in bookable.values()}, now)
+                ArtistShowsSummary.recount(cls.session, {e['artist_id'] for e in bookable.values()}, now)
+                cls.session.commit()
+
+            except exc.IntegrityError:
+                cls.session.rollback()
+                continue
+
+            except BaseException:
+                cls.session.rollback()
+                cls.session.close()
+                break
+
+            # the checks above leave no two bookable entries at the same venue and time
+            ids = {(venue_id, start_time): id for id, venue_id, start_time in inserted}
+
+            for position, entry in bookable.items():
+                results[position] = {"status": "created", "show_id": ids[(entry['venue_id'], entry['start_time'])]}
+
+            # without the shows the listeners can only drop everything, see `app.py`
+            shows = cls.get_booked(on_primary=True, ids=list(ids.values()))
+
+            cls.exception_handler.committed(cls, 'book', object_models=shows or None)
+
+            return results
+
+        for position in entries:
+            results.setdefault(position, {"status": "failed", "error": "the booking could not be completed"})
+
+        return results
+
+    @classmethod
+    def api_query(cls, load_only):
+        return cls.session.query(
+            cls,
+            Venue.name.label('venue_name'),
+            Artist.name.label('artist_name'),
+            Artist.image_link.label('artist_image_link')
+        ).join(
+            Artist,
+            cls.artist_id == Artist.id
+        ).join(
+            Venue,
+            cls.venue_id == Venue.id
+        ).options(
+            load_only
+        )
+
+
+# unnest the batch into rows, then match it against the shows' and its own time ranges
+BATCH_CONFLICTS = db.text(
+    """
+    WITH batch AS (
+        SELECT * FROM unnest(
+            CAST(:positions AS integer[]),
+            CAST(:venue_ids AS integer[]),
+            CAST(:artist_ids AS integer[]),
+            CAST(:start_times AS timestamp[]),
+            CAST(:end_times AS timestamp[])
+        ) AS batch (position, venue_id, artist_id, start_time, end_time)
     )
+    SELECT batch.position, show.id, NULL
+    FROM batch JOIN "Show" show
+    ON (show.venue_id = batch.venue_id OR show.artist_id = batch.artist_id)
+    AND tsrange(show.start_time, show.end_time) && tsrange(batch.start_time, batch.end_time)
+    UNION ALL
+    SELECT batch.position, NULL, earlier.position
+    FROM batch JOIN batch earlier
+    ON earlier.position < batch.position
+    AND (earlier.venue_id = batch.venue_id OR earlier.artist_id = batch.artist_id)
+    AND tsrange(earlier.start_time, earlier.end_time) && tsrange(batch.start_time, batch.end_time)
+    ORDER BY 1, 2, 3
+    """
+)
+
+
+@event.listens_for(Show, 'after_insert')
+def add_show_to_summaries(mapper, connection, target):
+    now = datetime.now()
+
+    VenueShowsSummary.add_show(connection, target.venue_id, target.start_time, now)
+    ArtistShowsSummary.add_show(connection, target.artist_id, target.start_time, now)
+
+
+@event.listens_for(Show, 'after_delete')
+def remove_show_from_summaries(mapper, connection, target):
+    now = datetime.now()
+
+    VenueShowsSummary.refresh(connection, [target.venue_id], now)
+    ArtistShowsSummary.refresh(connection, [target.artist_id], now)
+
+
+@event.listens_for(Show, 'after_update')
+def move_show_in_summaries(mapper, connection, target):
+    state = db.inspect(target)
+    moved = state.attrs.start_time.history.has_changes()
+    now = datetime.now()
+
+    for summary, column in ((VenueShowsSummary, 'venue_id'), (ArtistShowsSummary, 'artist_id')):
+        previous = state.attrs[column].history.deleted
+
+        if moved or previous:
+            # the profile that lost the show keeps its row, the one that got it may not have one yet
+            summary.refresh(connection, previous, now)
+            summary.recount(connection, [getattr(target, column)], now)
+
+
+def collect_counterparts(mapper, connection, target):
+    # the database cascades the delete to the shows, so no Show events fire for them
+    target._deleted_counterparts = type(target).counterpart_ids(connection, target.id)
+
+
+def refresh_counterparts(mapper, connection, target):
+    type(target).counterpart().shows_summary.refresh(
+        connection,
+        getattr(target, '_deleted_counterparts', ()),
+        datetime.now()
+    )
+
+
+for profile in (Venue, Artist):
+    event.listen(profile, 'before_delete', collect_counterparts)
+    event.listen(profile, 'after_delete', refresh_counterparts)
+
+
+@DBActions.exception_handler.listen
+def invalidate_search_cache(cls, action, **kwargs):
+    changed = DBActions.changed_models(cls, **kwargs)
+
+    # shows carry the counts listed next to every result, and removing a profile cascades to its shows
+    if any(issubclass(m, (Show, ShowsSummary)) for m in changed) or action == 'remove':
+        search_cache.invalidate(Venue, Artist)
+
+    else:
+        search_cache.invalidate(*changed)
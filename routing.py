@@ -0,0 +1,168 @@
+from itertools import count
+from threading import Lock
+from time import monotonic, time
+from flask import g, has_app_context, has_request_context, session as client_session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm, text
+
+
+# replay lag in seconds, 0 on a caught up replica or a server that isn't replicating
+REPLICA_LAG = text(
+    """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+    """
+)
+
+
+class ReplicaRouter:
+
+    def __init__(self, binds=(), max_lag=5, check_interval=2, sticky_for=5):
+        self._turn = count()
+        self._lock = Lock()
+        self.configure(binds, max_lag, check_interval, sticky_for)
+
+    def configure(self, binds=(), max_lag=5, check_interval=2, sticky_for=5):
+        self.binds = list(binds)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.sticky_for = sticky_for
+        self.lags = {}
+        self.routed = {"primary": 0, **{bind: 0 for bind in self.binds}}
+
+    def lag(self, bind, engine):
+        checked, lag = self.lags.get(bind, (None, None))
+
+        if checked is None or monotonic() - checked > self.check_interval:
+            try:
+                with engine.connect() as connection:
+                    lag = float(connection.scalar(REPLICA_LAG))
+
+            except Exception:
+                # an unreachable replica is skipped until the next check
+                lag = None
+
+            self.lags[bind] = (monotonic(), lag)
+
+        return lag
+
+    def choose(self, get_engine):
+        """
+        (1) Picks the next replica in round-robin order, skipping the ones
+            that are unreachable or lag more than max_lag seconds behind.
+        :param get_engine: Callable returning the engine of a bind key.
+        :return: The bind key of the chosen replica, None to use the primary.
+        """
+        with self._lock:
+            start = next(self._turn)
+
+        for offset in range(len(self.binds)):
+            bind = self.binds[(start + offset) % len(self.binds)]
+            lag = self.lag(bind, get_engine(bind))
+
+            if lag is not None and lag <= self.max_lag:
+                return bind
+
+        return None
+
+    def stick(self):
+        # reads after a write go to the primary for a while, so the writer sees its own change
+        if has_request_context() and self.binds:
+            g.db_primary = True
+            client_session['db_primary_until'] = time() + self.sticky_for
+
+    def is_sticky(self):
+        if not has_request_context():
+            return False
+
+        return g.get('db_primary', False) or client_session.get('db_primary_until', 0) > time()
+
+    def read_replica(self):
+        # remembered for the rest of the request, see `may_be_stale`
+        if has_app_context():
+            g.db_replica_read = True
+
+    def may_be_stale(self, invalidated_at):
+        """
+        (1) Tells if what was read so far may predate a write whose invalidation
+            ran at `invalidated_at` (a `time()`), a replica it was read from can be
+            up to max_lag behind, plus the time until its lag is checked again
+        """
+        if not has_app_context() or not g.get('db_replica_read', False):
+            return False
+
+        return time() - invalidated_at <= self.max_lag + self.check_interval
+
+    def count(self, bind):
+        with self._lock:
+            self.routed[bind or "primary"] += 1
+
+    def stats(self):
+        return {
+            "routed": dict(self.routed),
+            "lags": {bind: lag for bind, (checked, lag) in self.lags.items()},
+            "max_lag": self.max_lag
+        }
+
+
+class RoutingSession(SignallingSession):
+
+    def __init__(self, db, **options):
+        self.db = db
+        self.router = db.router
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        """
+        (1) Sends reads made inside `DBActions` fetch operations to a replica,
+            everything else, flushes and reads in a sticky window after a
+            write included, goes to the primary.
+        (2) A replica is chosen once per transaction, so all the reads of an
+            operation see the same snapshot.
+        """
+        if self.router.binds and self.info.get('route') == 'read' and not self._flushing:
+            if 'replica' not in self.info:
+                self.info['replica'] = None if self.router.is_sticky() else self.router.choose(
+                    lambda bind: self.db.get_engine(self.app, bind=bind)
+                )
+                self.router.count(self.info['replica'])
+
+            if self.info['replica'] is not None:
+                self.router.read_replica()
+                return self.db.get_engine(self.app, bind=self.info['replica'])
+
+        return super().get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def release_replica(session, transaction):
+    # the next transaction picks a replica again, by then the sticky window may have opened
+    if transaction.parent is None:
+        session.info.pop('replica', None)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def __init__(self, *args, **kwargs):
+        self.router = ReplicaRouter()
+        super().__init__(*args, **kwargs)
+
+    def init_app(self, app):
+        uris = app.config.get('SQLALCHEMY_REPLICA_URIS') or []
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.update({f"replica_{i}": uri for i, uri in enumerate(uris)})
+        app.config['SQLALCHEMY_BINDS'] = binds or None
+
+        self.router.configure(
+            binds=[f"replica_{i}" for i in range(len(uris))],
+            max_lag=app.config.get('SQLALCHEMY_REPLICA_MAX_LAG', 5),
+            check_interval=app.config.get('SQLALCHEMY_REPLICA_CHECK_INTERVAL', 2),
+            sticky_for=app.config.get('SQLALCHEMY_REPLICA_STICKY_FOR', 5)
+        )
+
+        super().init_app(app)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
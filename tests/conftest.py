@@ -0,0 +1,203 @@
+"""
+Fixtures of the query budget suite.
+
+The suite runs against a real Postgres, the one in TEST_DATABASE_URL, which
+is migrated to the latest revision and emptied before being seeded, so never
+point it at a database holding data you want to keep:
+
+    $ createdb fyyur_test
+    $ TEST_DATABASE_URL=postgresql://localhost/fyyur_test python -m pytest tests
+"""
+
+import os
+import statistics
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from time import perf_counter
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+
+# the latency budgets were set on a laptop serving REFERENCE_URL in about REFERENCE_MS,
+# they scale with how much slower the machine running the suite serves it, see `latency_scale`
+REFERENCE_URL = '/venues'
+REFERENCE_MS = 10
+REFERENCE_RUNS = 5
+
+# a fixed scale instead, 0 skips the latency checks
+LATENCY_SCALE = os.environ.get('BUDGET_LATENCY_SCALE')
+
+# large enough for the planner to prefer an index over a full scan whenever one fits
+SEED_VENUES = 1000
+SEED_ARTISTS = 1000
+SEED_SHOWS = 10000
+
+# names start with one of these, so a short search prefix matches a few percent of them
+NAME_WORDS = (
+    'Amber', 'Blue', 'Copper', 'Delta', 'Echo', 'Frost', 'Golden', 'Harbor', 'Iron', 'Jade',
+    'Kite', 'Lunar', 'Maple', 'Nova', 'Onyx', 'Pine', 'Quartz', 'River', 'Silver', 'Tidal'
+)
+
+
+class QueryLog:
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append((statement, parameters, executemany))
+
+
+@contextmanager
+def logged_queries():
+    # counts everything the engine runs, streamed responses included, unlike X-Query-Count
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    log = QueryLog()
+    event.listen(Engine, 'before_cursor_execute', log.record)
+
+    try:
+        yield log
+
+    finally:
+        event.remove(Engine, 'before_cursor_execute', log.record)
+
+
+def seed(db, models):
+    """
+    (1) Seeds venues, artists and shows, half of the shows in the past and
+        half upcoming, spread so none of them overlap at a venue or for an
+        artist, and rebuilds the shows summaries from them
+    """
+    states = [models.State.CA, models.State.NY, models.State.TX, models.State.WA]
+    genres = list(models.Genres)
+    now = datetime.now().replace(minute=0, second=0, microsecond=0)
+
+    db.session.execute(models.Venue.__table__.insert(), [
+        {
+            "name": f"{NAME_WORDS[i % len(NAME_WORDS)]} Venue {i:04}", "city": f"City {i % 50}", "state": states[i % len(states)],
+            "address": f"{i} Main St", "phone": "555-555-5555", "genres": [genres[i % len(genres)]]
+        } for i in range(SEED_VENUES)
+    ])
+    db.session.execute(models.Artist.__table__.insert(), [
+        {
+            "name": f"{NAME_WORDS[i % len(NAME_WORDS)]} Artist {i:04}", "city": f"City {i % 50}", "state": states[i % len(states)],
+            "phone": "555-555-5555", "genres": [genres[i % len(genres)]]
+        } for i in range(SEED_ARTISTS)
+    ])
+
+    # show i starts 3 * i hours after the first one, so no two shows ever overlap
+    first = now - timedelta(hours=3 * (SEED_SHOWS // 2))
+    db.session.execute(models.Show.__table__.insert(), [
+        {
+            "venue_id": i % SEED_VENUES + 1,
+            "artist_id": (i * 7) % SEED_ARTISTS + 1,
+            "start_time": first + timedelta(hours=3 * i),
+            "end_time": first + timedelta(hours=3 * i) + models.Show.default_duration
+        } for i in range(SEED_SHOWS)
+    ])
+    db.session.commit()
+
+    for summary in (models.VenueShowsSummary, models.ArtistShowsSummary):
+        assert summary.rebuild(), f"{summary.__tablename__} could not be rebuilt"
+
+
+@pytest.fixture(scope='session')
+def app():
+    if not TEST_DATABASE_URL:
+        pytest.skip("set TEST_DATABASE_URL to a throwaway Postgres database to run the query budgets")
+
+    os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+
+    from flask_migrate import upgrade
+    from app import app
+    import models
+    from models import db
+
+    app.config.update(
+        TESTING=True,
+        WTF_CSRF_ENABLED=False,
+        SQLALCHEMY_DATABASE_URI=TEST_DATABASE_URL
+    )
+
+    with app.app_context():
+        upgrade()
+
+        tables = ", ".join(f'"{table.name}"' for table in db.metadata.sorted_tables)
+        db.session.execute(f"TRUNCATE {tables} RESTART IDENTITY CASCADE")
+        db.session.commit()
+
+        seed(db, models)
+
+        # fresh statistics, so the plans are the ones a populated database gets
+        db.session.execute("ANALYZE")
+        db.session.commit()
+
+    return app
+
+
+@pytest.fixture(scope='session')
+def latency_scale(app):
+    """
+    (1) Times REFERENCE_URL, uncached, and compares it to REFERENCE_MS
+    :return: (float) the factor the latency budgets are multiplied by, never
+             below 1, or BUDGET_LATENCY_SCALE when it is set
+    """
+    if LATENCY_SCALE is not None:
+        return float(LATENCY_SCALE)
+
+    from app import page_cache
+
+    client = app.test_client()
+    runs = []
+
+    # the first run warms up the connections and templates, it is left out
+    for _ in range(REFERENCE_RUNS + 1):
+        page_cache.invalidate('pages')
+        started = perf_counter()
+        client.get(REFERENCE_URL).get_data()
+        runs.append((perf_counter() - started) * 1000)
+
+    return max(1.0, statistics.median(runs[1:]) / REFERENCE_MS)
+
+
+@pytest.fixture
+def client(app):
+    from app import page_cache
+    from models import search_cache
+
+    # budgets are for cold requests, a cached page or search runs no queries at all
+    page_cache.invalidate('pages')
+    search_cache.entries.clear()
+
+    return app.test_client()
+
+
+@pytest.fixture
+def measure(client):
+    """
+    (1) Runs a request against the test client
+    :return: a function taking the request method, url and test client
+             keyword arguments, returning the response, the queries it ran
+             (a QueryLog) and the time it took in milliseconds
+    """
+
+    def run(method, url, **kwargs):
+        with logged_queries() as log:
+            started = perf_counter()
+            response = client.open(url, method=method, **kwargs)
+            response.get_data()
+            elapsed = (perf_counter() - started) * 1000
+
+        return response, log, elapsed
+
+    return run
@@ -0,0 +1,196 @@
+"""
+Query count and latency budgets of every route.
+
+A budget is the most queries a cold request (nothing cached) may run, and
+the most milliseconds it may take against the seeded database, scaled to the
+machine running the suite (see `conftest.latency_scale`). Counts that
+grow with the data, an N+1 loop over a relationship or a summary read per
+row, break the count budgets, and filters no index can serve break
+`test_filters_use_indexes`.
+"""
+
+import statistics
+from collections import namedtuple
+
+import pytest
+
+# writes come with a query whose result the write has to change
+Budget = namedtuple('Budget', 'endpoint method url kwargs queries ms written', defaults=(None,))
+
+VENUE_FORM = {'name': 'Budget Venue', 'city': 'San Francisco', 'state': 'CA', 'address': '1 Budget St',
+              'genres': ['Jazz']}
+ARTIST_FORM = {'name': 'Budget Artist', 'city': 'San Francisco', 'state': 'CA', 'genres': ['Jazz']}
+
+# reads run three times, the median time is checked against the budget
+READS = [
+    Budget('index', 'GET', '/', {}, 0, 50),
+    Budget('venues', 'GET', '/venues', {}, 1, 150),
+    Budget('venues', 'GET', '/venues?per_page=100', {}, 1, 250),
+    Budget('artists', 'GET', '/artists', {}, 1, 150),
+    Budget('shows', 'GET', '/shows', {}, 1, 150),
+    Budget('show_venue', 'GET', '/profile/venue/1', {}, 4, 150),
+    Budget('show_artist', 'GET', '/profile/artist/1', {}, 4, 150),
+    Budget('search_venues', 'POST', '/venues/search', {'json': {'search_term': 'Venue 0042'}}, 2, 100),
+    Budget('search_venues', 'POST', '/venues/search', {'json': {'search_term': 'qu'}}, 2, 100),
+    Budget('search_artists', 'POST', '/artists/search', {'json': {'search_term': 'Artist 0042'}}, 2, 100),
+    Budget('search_artists', 'POST', '/artists/search', {'json': {'search_term': 'ja'}}, 2, 100),
+    Budget('create_venue', 'GET', '/venues/create', {}, 0, 100),
+    Budget('create_artist', 'GET', '/artists/create', {}, 0, 100),
+    Budget('create_show', 'GET', '/shows/create', {}, 0, 100),
+    Budget('edit_venue', 'GET', '/venues/2/edit', {}, 1, 100),
+    Budget('edit_artist', 'GET', '/artists/2/edit', {}, 1, 100),
+    Budget('api_v1.list_resources', 'GET', '/api/v1/venues?per_page=100', {}, 1, 150),
+    Budget('api_v1.list_resources', 'GET', '/api/v1/shows?per_page=100', {}, 1, 150),
+    Budget('api_v1.get_resource', 'GET', '/api/v1/artists/1', {}, 1, 50),
+    Budget('export', 'GET', '/export/shows', {}, 1, 1500),
+    Budget('status_pool', 'GET', '/status/pool', {}, 0, 50),
+    Budget('status_replicas', 'GET', '/status/replicas', {}, 0, 50),
+    Budget('status_metrics', 'GET', '/metrics', {}, 0, 100),
+]
+
+# writes run once, each on its own rows
+WRITES = [
+    Budget('create_venue', 'POST', '/venues/create', {'data': VENUE_FORM}, 2, 100,
+           """SELECT count(*) FROM "Venue" WHERE name = 'Budget Venue'"""),
+    Budget('create_artist', 'POST', '/artists/create', {'data': ARTIST_FORM}, 2, 100,
+           """SELECT count(*) FROM "Artist" WHERE name = 'Budget Artist'"""),
+    Budget('create_show', 'POST', '/shows/create', {
+        'data': {'venue_id': '3', 'artist_id': '4', 'start_time': '2040-01-01 20:00:00', 'duration': '90'}
+    }, 8, 150, """SELECT count(*) FROM "Show" WHERE venue_id = 3 AND start_time = '2040-01-01 20:00'"""),
+    Budget('create_shows_batch', 'POST', '/shows/batch', {
+        'json': {'shows': [
+            {'venue_id': v, 'artist_id': v + 1, 'start_time': '2040-02-01T20:00:00'} for v in range(10, 60)
+        ]}
+    }, 6, 300, """SELECT count(*) FROM "Show" WHERE start_time = '2040-02-01 20:00'"""),
+    Budget('edit_venue', 'POST', '/venues/5/edit', {'data': VENUE_FORM}, 3, 100,
+           'SELECT name, city FROM "Venue" WHERE id = 5'),
+    Budget('edit_artist', 'POST', '/artists/5/edit', {'data': ARTIST_FORM}, 3, 100,
+           'SELECT name, city FROM "Artist" WHERE id = 5'),
+    Budget('delete_venue', 'DELETE', '/venues/999/delete', {}, 4, 150,
+           'SELECT count(*) FROM "Venue" WHERE id = 999'),
+    Budget('delete_artist', 'DELETE', '/artists/999/delete', {}, 4, 150,
+           'SELECT count(*) FROM "Artist" WHERE id = 999'),
+]
+
+
+def budget_id(budget):
+    term = budget.kwargs.get('json', {}).get('search_term')
+    return f"{budget.method} {budget.url}" + (f" {term!r}" if term else "")
+
+
+def check(budget, response, queries, ms, latency_scale):
+    assert response.status_code < 400, response.get_data(as_text=True)[:500]
+
+    assert queries.count <= budget.queries, (
+        f"{budget.method} {budget.url} ran {queries.count} queries, its budget is {budget.queries}:\n"
+        + "\n".join(statement for statement, parameters, executemany in queries.statements)
+    )
+
+    if latency_scale:
+        assert ms <= budget.ms * latency_scale, (
+            f"{budget.method} {budget.url} took {ms:.1f}ms, its budget is {budget.ms * latency_scale:.0f}ms"
+        )
+
+
+def written(app, budget):
+    from models import db
+
+    with app.app_context():
+        with db.engine.connect() as connection:
+            return connection.execute(budget.written).fetchall()
+
+
+@pytest.mark.parametrize('budget', READS, ids=budget_id)
+def test_read_budget(budget, app, measure, latency_scale):
+    from app import page_cache
+    from models import search_cache
+
+    runs = []
+
+    for _ in range(3):
+        page_cache.invalidate('pages')
+        search_cache.entries.clear()
+        runs.append(measure(budget.method, budget.url, **budget.kwargs))
+
+    response, queries, ms = runs[-1]
+    check(budget, response, queries, statistics.median(ms for r, q, ms in runs), latency_scale)
+
+
+@pytest.mark.parametrize('budget', WRITES, ids=budget_id)
+def test_write_budget(budget, app, measure, latency_scale):
+    before = written(app, budget)
+    response, queries, ms = measure(budget.method, budget.url, **budget.kwargs)
+    check(budget, response, queries, ms, latency_scale)
+
+    if response.is_json:
+        assert response.get_json().get('status') in ('succeeded', 'partial'), response.get_json()
+
+    # a form failing validation renders with a 200 too, the write has to show in the database
+    after = written(app, budget)
+    assert after != before, f"{budget.method} {budget.url} left {budget.written} at {after}"
+
+
+def test_every_route_has_a_budget(app):
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules() if rule.endpoint != 'static'}
+    budgeted = {budget.endpoint for budget in READS + WRITES}
+
+    assert endpoints <= budgeted, f"routes without a budget: {', '.join(sorted(endpoints - budgeted))}"
+
+
+def plan_nodes(plan):
+    yield plan
+
+    for child in plan.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+FULL_SCANS = ('Seq Scan', 'Index Scan', 'Index Only Scan')
+
+
+def unindexed_filters(connection, statements):
+    """
+    (1) Explains the statements with sequential scans turned off, so the
+        planner takes any index that can serve a filter
+    :return: the (relation, filter, statement) of the scans still filtering
+             rows one by one, a whole table or a whole index
+    """
+    found = []
+    cursor = connection.cursor()
+    cursor.execute("SET enable_seqscan = off")
+
+    for statement, parameters, executemany in statements:
+        if executemany or not statement.lstrip().upper().startswith(('SELECT', 'WITH', 'UPDATE', 'DELETE')):
+            continue
+
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+
+        for node in plan_nodes(cursor.fetchone()[0][0]['Plan']):
+            # bitmap heap scans are fed by an index, other scans need an index condition
+            if node['Node Type'] in FULL_SCANS and 'Filter' in node and 'Index Cond' not in node:
+                found.append((node['Relation Name'], node['Filter'], statement))
+
+    return found
+
+
+@pytest.mark.parametrize('budget', [
+    budget for budget in READS if budget.queries and budget.endpoint != 'export'
+], ids=budget_id)
+def test_filters_use_indexes(budget, app, measure):
+    from models import db
+
+    response, queries, ms = measure(budget.method, budget.url, **budget.kwargs)
+
+    with app.app_context():
+        connection = db.engine.raw_connection()
+
+        try:
+            found = unindexed_filters(connection, queries.statements)
+
+        finally:
+            connection.rollback()
+            connection.close()
+
+    assert not found, "\n\n".join(
+        f'"{relation}" filtered on {condition} without an index:\n{statement}'
+        for relation, condition, statement in found
+    )